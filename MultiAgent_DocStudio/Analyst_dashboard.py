@@ -51,10 +51,16 @@ Data (CSV):
         )
         try:
             llm_summarizer = LLMSummarizer(provider=llm_provider, model=llm_model_key)
+            st.markdown("<h4>LLM Analysis & Recommendations</h4>", unsafe_allow_html=True)
+            stream_placeholder = st.empty()
+            analysis = ""
             with st.spinner("Analyzing campaign data with LLM..."):
-                analysis = llm_summarizer.generate(prompt)
+                for delta in llm_summarizer.generate_stream(prompt):
+                    analysis += delta
+                    stream_placeholder.markdown(analysis)
+            analysis = analysis.strip()
+            stream_placeholder.empty()
             st.success("Analysis complete!")
-            st.markdown("<h4>LLM Analysis & Recommendations</h4>", unsafe_allow_html=True)
             st.text_area("Analysis Output", value=analysis, height=400, key="analyst_output_area")
         except Exception as e:
             st.error(f"Error analyzing campaign: {str(e)}") 
\ No newline at end of file
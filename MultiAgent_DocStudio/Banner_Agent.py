@@ -40,10 +40,16 @@ Create a social media banner or post for the following campaign.
             )
             try:
                 llm_summarizer = LLMSummarizer(provider=llm_provider, model=llm_model_key)
+                st.markdown("<h4>Generated Banner/Post</h4>", unsafe_allow_html=True)
+                stream_placeholder = st.empty()
+                content = ""
                 with st.spinner("Generating banner/post content..."):
-                    content = llm_summarizer.generate(prompt)
+                    for delta in llm_summarizer.generate_stream(prompt):
+                        content += delta
+                        stream_placeholder.markdown(content)
+                content = content.strip()
+                stream_placeholder.empty()
                 st.success("Banner/Post generated!")
-                st.markdown("<h4>Generated Banner/Post</h4>", unsafe_allow_html=True)
                 st.text_area("Generated Banner/Post", value=content, height=200, key="generated_banner_content_area")
                 st.download_button("Download as TXT", data=content, file_name="generated_banner_post.txt")
             except Exception as e:
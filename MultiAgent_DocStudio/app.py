@@ -1,6 +1,5 @@
 import streamlit as st
 import os
-import tiktoken
 from datetime import datetime
 from dotenv import load_dotenv
 from document_processor import DocumentProcessor
@@ -10,6 +9,8 @@ from compliance_agent import ComplianceAgent
 from urllib.parse import parse_qs
 from prompt_db import PromptDB
 from compliance_chatbot import ComplianceChatbot
+from token_counter import count_tokens, is_estimate
+from config import PERFORMANCE_CONFIG, RULE_CONFIG
 from jinja2 import Template
 
 
@@ -212,9 +213,8 @@ if st.session_state['active_agent'] == 'summarizer':
         else:
             word_count = len(user_text.split())
             st.write(f"**Word Count:** {word_count:,}")
-            encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")  
-            token_count = len(encoding.encode(user_text))
-            st.write(f"**Estimated Tokens:** {token_count:,}")
+            token_count = count_tokens(user_text, llm_model_key)
+            st.write(f"**Estimated Tokens:** {'~' if is_estimate(user_text) else ''}{token_count:,}")
             with st.expander("View Input Text"):
                 st.text_area("Input Text", value=user_text[:1000] + ("..." if len(user_text) > 1000 else ""), height=200, disabled=True)
             if summarize_text_btn:
@@ -267,6 +267,8 @@ if st.session_state['active_agent'] == 'summarizer':
             st.warning("Please upload at least one document to summarize or extract key takeaways.")
         else:
             st.markdown("<h4 style='margin-top:2rem;'>Uploaded Document Actions</h4>", unsafe_allow_html=True)
+            # SQLite rows are written in one transaction after the loop
+            pending_sqlite_saves = []
             for idx, uploaded_file in enumerate(uploaded_files):
                 st.markdown('<div class="file-card" style="background:#f7f9fa;border-radius:12px;padding:1.5rem 1rem;margin-bottom:1.5rem;box-shadow:0 1px 4px rgba(0,0,0,0.04);">', unsafe_allow_html=True)
                 st.markdown(f"<h4>📄 {uploaded_file.name}</h4>", unsafe_allow_html=True)
@@ -276,9 +278,8 @@ if st.session_state['active_agent'] == 'summarizer':
                     extracted_text = document_processor.extract_text(uploaded_file)
                     word_count = len(extracted_text.split())
                     st.write(f"**Word Count:** {word_count:,}")
-                    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-                    token_count = len(encoding.encode(extracted_text))
-                    st.write(f"**Estimated Tokens:** {token_count:,}")
+                    token_count = count_tokens(extracted_text, llm_model_key)
+                    st.write(f"**Estimated Tokens:** {'~' if is_estimate(extracted_text) else ''}{token_count:,}")
                     with st.expander("View Extracted Text"):
                         st.text_area("Extracted Text", value=extracted_text[:1000] + ("..." if len(extracted_text) > 1000 else ""), height=200, disabled=True)
                     if summarize_file_btn:
@@ -305,11 +306,12 @@ if st.session_state['active_agent'] == 'summarizer':
                                     }
                                     if storage_type == "JSON":
                                         storage_manager.save_to_json(summary_data)
+                                        st.info("Summary saved!")
                                     elif storage_type == "CSV":
                                         storage_manager.save_to_csv(summary_data)
+                                        st.info("Summary saved!")
                                     else:
-                                        storage_manager.save_to_sqlite(summary_data)
-                                    st.info("Summary saved!")
+                                        pending_sqlite_saves.append(summary_data)
                                 else:
                                     st.error("Failed to generate summary.")
                             except Exception as e:
@@ -329,6 +331,12 @@ if st.session_state['active_agent'] == 'summarizer':
                 except Exception as e:
                     st.error(f"Error processing file: {str(e)}")
                 st.markdown('</div>', unsafe_allow_html=True)
+            if pending_sqlite_saves:
+                try:
+                    saved_count = storage_manager.save_many(pending_sqlite_saves)
+                    st.info(f"{saved_count} summar{'y' if saved_count == 1 else 'ies'} saved!")
+                except Exception as e:
+                    st.error(f"Error saving summaries: {str(e)}")
 elif active_agent == 'compliance':
    
     with st.sidebar:
@@ -568,6 +576,21 @@ Language: {language}
     st.markdown('<hr class="section-sep">', unsafe_allow_html=True)
     st.markdown('<div class="text-card">', unsafe_allow_html=True)
     domain = st.selectbox("Select Compliance Domain", ["GDPR", "HIPAA", "SOC 2", "ISO 27001", "PCI-DSS"], index=0)
+    use_prefilter = st.checkbox(
+        "Rule pre-filter",
+        value=RULE_CONFIG["prefilter_enabled"],
+        help="Scan for PII/PHI/PCI markers first and only send sections with matches to the LLM"
+    )
+    use_pii_detectors = st.checkbox(
+        "PII/PHI detectors",
+        value=RULE_CONFIG["pii_detectors_enabled"],
+        help="Flag emails, SSNs, dates of birth, card numbers, IBANs, MRNs and phone numbers alongside the LLM review"
+    )
+    use_incremental = st.checkbox(
+        "Reuse results for unchanged sections",
+        value=PERFORMANCE_CONFIG["incremental_recheck"],
+        help="When re-checking a revised document, only sections that changed since an earlier check are sent to the LLM"
+    )
     st.markdown('</div>', unsafe_allow_html=True)
     run_check = st.button("Run Compliance Check", use_container_width=True)
     if run_check:
@@ -577,24 +600,24 @@ Language: {language}
             with st.spinner(f"Running compliance check for {domain}..."):
                 try:
                     # Pass provider and model to ComplianceAgent
-                    agent = ComplianceAgent(domain=domain, provider=llm_provider, model=llm_model_key)
+                    agent = ComplianceAgent(domain=domain, provider=llm_provider, model=llm_model_key, prefilter=use_prefilter, detect_pii=use_pii_detectors, incremental=use_incremental)
                     
-                    all_text = ''
+                    compliance_prompt = st.session_state.get('compliance_prompt', '')
+                    file_results = []
                     if compliance_files:
-                        from document_processor import DocumentProcessor
-                        processor = DocumentProcessor()
-                        for f in compliance_files:
-                            try:
-                                all_text += "\n\n" + processor.extract_text(f)
-                            except Exception as e:
-                                st.error(f"Error extracting text from {f.name}: {e}")
+                        # Files are extracted and checked concurrently; each one reports as soon as it finishes
+                        for file_result in agent.check_documents(compliance_files, custom_prompt=compliance_prompt):
+                            file_results.append(file_result)
+                            if file_result['error']:
+                                st.error(f"Error processing {file_result['source_file']}: {file_result['error']}")
+                            else:
+                                st.info(f"Checked {file_result['source_file']} ({len(file_result['results'])} section(s))")
                     
-                    if not all_text.strip():
+                    report = agent.aggregate_report(file_results)
+                    results = report['results']
+                    if not results:
                         st.warning("Please provide text or upload a document.")
                     else:
-                       
-                        compliance_prompt = st.session_state.get('compliance_prompt', '')
-                        results = agent.check_compliance(all_text, custom_prompt=compliance_prompt)
                         
                         
                         st.success(f" Compliance check complete for {domain}")
@@ -663,6 +686,8 @@ Language: {language}
                         
                         for idx, result in enumerate(results):
                             st.markdown(f"<h3> Analysis Result {idx+1}</h3>", unsafe_allow_html=True)
+                            if isinstance(result, dict) and 'source_file' in result:
+                                st.caption(f"{result['source_file']} · section {result['chunk_index'] + 1}")
                             
                             if isinstance(result, dict):
                                 
@@ -696,7 +721,7 @@ Language: {language}
                                 
                                 
                                 other_fields = {k: v for k, v in result.items() 
-                                              if k not in ['compliance_summary', 'approvals', 'violations']}
+                                              if k not in ['compliance_summary', 'approvals', 'violations', 'source_file', 'chunk_index', 'rule_findings']}
                                 if other_fields:
                                     st.markdown('<div class="compliance-card">', unsafe_allow_html=True)
                                     st.markdown(f"<h4> Additional Information</h4>", unsafe_allow_html=True)
@@ -727,21 +752,12 @@ Language: {language}
                             st.markdown("<h3> Overall Compliance Assessment</h3>", unsafe_allow_html=True)
                             
                             
-                            total_violations = 0
-                            total_approvals = 0
+                            total_violations = report['total_violations']
+                            total_approvals = report['total_approvals']
+                            overall_status = report['overall_status']
                             
-                            for result in results:
-                                if isinstance(result, dict):
-                                    if 'violations' in result:
-                                        if isinstance(result['violations'], list):
-                                            total_violations += len(result['violations'])
-                                        else:
-                                            total_violations += 1
-                                    if 'approvals' in result:
-                                        if isinstance(result['approvals'], list):
-                                            total_approvals += len(result['approvals'])
-                                        else:
-                                            total_approvals += 1
+                            if len(report['files']) > 1:
+                                st.dataframe(report['files'], use_container_width=True, hide_index=True)
                             
                             
                             col1, col2, col3 = st.columns(3)
@@ -750,12 +766,14 @@ Language: {language}
                             with col2:
                                 st.metric("Compliant Points", total_approvals, delta=None)
                             with col3:
-                                compliance_score = "🟢 Compliant" if total_violations == 0 else "🔴 Non-Compliant" if total_violations > 3 else "🟡 Needs Review"
-                                st.metric("Overall Status", compliance_score, delta=None)
+                                status_icons = {"Compliant": "🟢", "Non-Compliant": "🔴", "Needs Review": "🟡", "Not Reviewed": "⚪"}
+                                st.metric("Overall Status", f"{status_icons[overall_status]} {overall_status}", delta=None)
                             
                             # Add recommendations
                             if total_violations > 0:
                                 st.warning(f"⚠️ **Action Required:** {total_violations} compliance issue(s) found. Please review and address the violations listed above.")
+                            elif overall_status == "Not Reviewed":
+                                st.info("No sections were sent for LLM review, so compliance has not been assessed. Turn off the rule pre-filter to review the full document.")
                             else:
                                 st.success("🎉 **Excellent!** No compliance violations detected. Your document appears to meet the specified requirements.")
                             
@@ -770,8 +788,9 @@ Language: {language}
                                 'analysis_date': datetime.now().isoformat(),
                                 'total_violations': total_violations,
                                 'total_approvals': total_approvals,
-                                'overall_status': "Compliant" if total_violations == 0 else "Non-Compliant" if total_violations > 3 else "Needs Review",
+                                'overall_status': overall_status,
                                 'results': results,
+                                'files': report['files'],
                                 'files_analyzed': [f.name for f in compliance_files] if compliance_files else ['text_input']
                             }
                             
@@ -878,10 +897,16 @@ Tone: Inspiring and concise. Include relevant hashtags.
             try:
                 # Use the selected LLM backend
                 llm_summarizer = LLMSummarizer(provider=llm_provider, model=llm_model_key)
+                st.markdown("<h4>Generated Content</h4>", unsafe_allow_html=True)
+                stream_placeholder = st.empty()
+                content = ""
                 with st.spinner("Generating content..."):
-                    content = llm_summarizer.generate(prompt)
+                    for delta in llm_summarizer.generate_stream(prompt):
+                        content += delta
+                        stream_placeholder.markdown(content)
+                content = content.strip()
+                stream_placeholder.empty()
                 st.success("Content generated!")
-                st.markdown("<h4>Generated Content</h4>", unsafe_allow_html=True)
                 st.text_area("Generated Content", value=content, height=400, key="generated_content_area")
                 st.download_button("Download as TXT", data=content, file_name="generated_content.txt")
             except Exception as e:
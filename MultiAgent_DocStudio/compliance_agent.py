@@ -1,33 +1,80 @@
-import json
-from typing import List, Dict, Optional
-from llm_summarizer import LLMSummarizer
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Union
+from compliance_store import ComplianceResultStore, content_hash, get_result_store
+from document_processor import DocumentProcessor
+from json_extractor import COMPLIANCE_SCHEMA, extract_json_text, parse_llm_json
+from llm_summarizer import AsyncLLMSummarizer, LLMSummarizer, gather_bounded
+from pii_detectors import PIIDetector
+from rule_engine import RuleEngine
 from storage_manager import StorageManager
-import re
+from text_chunker import TokenChunker
+from config import CHUNK_CONFIG, PERFORMANCE_CONFIG, RULE_CONFIG
 
 class ComplianceAgent:
    
-    def __init__(self, domain: str = "GDPR", rules: Optional[List[Dict]] = None, provider: str = "openai", model: str = "gpt-3.5-turbo"):
+    def __init__(self, domain: str = "GDPR", rules: Optional[List[Dict]] = None, provider: str = "openai", model: str = "gpt-3.5-turbo",
+                 prefilter: Optional[bool] = None, detect_pii: Optional[bool] = None, incremental: Optional[bool] = None):
         self.domain = domain
         self.rules = rules or []
+        self.prefilter = RULE_CONFIG["prefilter_enabled"] if prefilter is None else prefilter
+        self.detect_pii = RULE_CONFIG["pii_detectors_enabled"] if detect_pii is None else detect_pii
+        self._rule_engine = None
+        self._pii_detector = None
+        self.incremental = PERFORMANCE_CONFIG["incremental_recheck"] if incremental is None else incremental
+        self._result_store = None
+        self.model = model
+        self.provider = provider
         self.llm = LLMSummarizer(provider=provider, model=model)
+        self._async_llm = None
         self.storage = StorageManager()
+        # Incremental re-checks need content-defined boundaries so unchanged text keeps its chunks
+        self.chunker = TokenChunker(model=model, max_tokens=CHUNK_CONFIG["compliance_chunk_tokens"],
+                                    content_defined=self.incremental)
 
-    def ingest_and_chunk(self, text: str, chunk_size: int = 1200) -> List[str]:
+    @property
+    def async_llm(self) -> AsyncLLMSummarizer:
+        # Only built when the async path is used
+        if self._async_llm is None:
+            self._async_llm = AsyncLLMSummarizer(provider=self.provider, model=self.model)
+        return self._async_llm
+
+    @property
+    def rule_engine(self) -> RuleEngine:
+        # Custom rules when given, otherwise the built-in PII/PHI/PCI rules for this domain
+        if self._rule_engine is None:
+            self._rule_engine = RuleEngine(self.rules or None, domain=None if self.rules else self.domain)
+        return self._rule_engine
+
+    @property
+    def pii_detector(self) -> PIIDetector:
         
+        if self._pii_detector is None:
+            self._pii_detector = PIIDetector(domain=self.domain)
+        return self._pii_detector
+
+    @property
+    def result_store(self) -> ComplianceResultStore:
+        
+        if self._result_store is None:
+            self._result_store = get_result_store()
+        return self._result_store
+
+    def ingest_and_chunk(self, text: str, max_tokens: Optional[int] = None) -> List[str]:
         
-        paragraphs = text.split('\n\n')
-        chunks = []
-        current = ""
-        for para in paragraphs:
-            if len(current) + len(para) < chunk_size:
-                current += para + "\n\n"
-            else:
-                if current:
-                    chunks.append(current.strip())
-                current = para + "\n\n"
-        if current:
-            chunks.append(current.strip())
-        return chunks
+        return list(self.iter_chunks(text, max_tokens))
+
+    def iter_chunks(self, text: Union[str, Iterable[str]], max_tokens: Optional[int] = None) -> Iterator[str]:
+        # Sentence-aligned, token-budgeted chunks with overlap, produced lazily.
+        # Accepts either a full string or a stream of blocks (DocumentProcessor.iter_text_blocks).
+        chunker = self.chunker
+        if max_tokens is not None:
+            chunker = TokenChunker(model=self.model, max_tokens=max_tokens, content_defined=self.chunker.content_defined)
+        if isinstance(text, str):
+            return chunker.iter_chunks(text)
+        # Blocks from DocumentProcessor.iter_text_blocks carry their own separators
+        return chunker.iter_chunks_from_blocks(text, separator="")
 
     def build_prompt(self, chunk: str) -> str:
         
@@ -41,53 +88,301 @@ class ComplianceAgent:
         )
 
     def _extract_json(self, text: str) -> str:
+        # Balanced-brace extraction, so nested objects and braces inside strings survive
+        return extract_json_text(text)
+
+    def check_compliance(self, text: Union[str, Iterable[str]], custom_prompt: str = None, max_workers: Optional[int] = None) -> List[Dict]:
        
+        max_workers = max_workers or PERFORMANCE_CONFIG["max_concurrent_requests"]
+        if self.prefilter or self.detect_pii:
+            planned, skipped = self._plan_chunks(text if isinstance(text, str) else "".join(text))
+            if not planned:
+                return [self._prefiltered_result(skipped)]
+            check = lambda item: self._check_chunk(item[1], custom_prompt, item[2])
+            items = planned
+        else:
+            check = lambda chunk: self._check_chunk(chunk, custom_prompt)
+            items = self.iter_chunks(text)
+        if max_workers <= 1:
+            return [check(item) for item in items]
+        return list(self._map_in_order(check, items, max_workers))
+
+    def _plan_chunks(self, text: str) -> Tuple[List[Tuple[int, str, Optional[List[Dict]]]], int]:
+        # Returns the (chunk_index, chunk, findings) to send to the LLM and how many were skipped.
+        # With the pre-filter on, the whole document is scanned once and only chunks with
+        # rule findings (violations or ambiguous context terms) are escalated. With the PII
+        # detectors on, every chunk is also scanned as one batch and chunks with detector
+        # findings are escalated too. Finding offsets are relative to the document in both cases.
+        if not self.prefilter and not self.detect_pii:
+            return [(i, chunk, None) for i, chunk in enumerate(self.iter_chunks(text))], 0
+        spans = list(self.chunker.iter_spans(text))
+        # A domain without built-in rules (e.g. SOC 2), or custom rules without patterns, leave
+        # nothing to pre-filter on, so every chunk goes to the LLM rather than none
+        if self.prefilter and self.rule_engine.has_matchers:
+            findings = self.rule_engine.assign_to_spans(self.rule_engine.scan(text), spans)
+            review_all = False
+        else:
+            findings = [[] for _ in spans]
+            review_all = True
         
-        text = text.strip()
-        text = re.sub(r'^```[a-zA-Z]*', '', text)
-        text = re.sub(r'```$', '', text)
-       
-        match = re.search(r'\{[\s\S]*?\}', text)
-        if match:
-            return match.group(0)
-        return text  
+        if self.detect_pii and spans:
+            detected = self.pii_detector.findings_by_chunk([text[start:end] for start, end in spans])
+            for i, chunk_findings in enumerate(detected):
+                if not chunk_findings:
+                    continue
+                offset = spans[i][0]
+                seen = {(f["rule"], f["start"], f["end"]) for f in findings[i]}
+                for finding in chunk_findings:
+                    finding["start"] += offset
+                    finding["end"] += offset
+                    if (finding["rule"], finding["start"], finding["end"]) not in seen:
+                        findings[i].append(finding)
+                findings[i].sort(key=lambda finding: (finding["start"], finding["end"]))
+        
+        planned = [i for i, chunk_findings in enumerate(findings) if review_all or chunk_findings]
+        return [(i, text[spans[i][0]:spans[i][1]], findings[i]) for i in planned], len(spans) - len(planned)
 
-    def check_compliance(self, text: str, custom_prompt: str = None) -> List[Dict]:
-       
-        chunks = self.ingest_and_chunk(text)
+    def _prefiltered_result(self, skipped: int) -> Dict:
+        # Nothing here was reviewed, so aggregate_report never counts it as compliant
+        return {
+            "compliance_summary": f"The rule pre-filter found nothing to escalate in {skipped} section(s), so none were sent for LLM review.",
+            "approvals": [],
+            "violations": [],
+            "prefiltered": True,
+            "sections_skipped": skipped
+        }
+
+    def _map_in_order(self, fn: Callable, items: Iterable, max_workers: int) -> Iterator:
+        # Keeps at most 2 * max_workers chunks in flight and yields results in input order
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for item in items:
+                pending.append(executor.submit(fn, item))
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def check_documents(self, files: Iterable[Any], custom_prompt: str = None, processor: Optional[DocumentProcessor] = None,
+                        extraction_workers: Optional[int] = None, llm_workers: Optional[int] = None) -> Iterator[Dict]:
+        # Each file is extracted and chunked on one pool while its chunks are checked on another,
+        # and a file's results are yielded as soon as its last chunk finishes. A file that fails
+        # to extract is reported on its own without holding up the rest.
+        processor = processor or DocumentProcessor()
+        extraction_workers = extraction_workers or PERFORMANCE_CONFIG["extraction_workers"]
+        llm_workers = llm_workers or PERFORMANCE_CONFIG["max_concurrent_requests"]
+        files = list(files)
+        names = [getattr(f, "name", str(f)) for f in files]
+        results: Dict[int, List] = {}
+        remaining: Dict[int, int] = {}
+        # Extraction threads block once this many chunks are queued, so plain-text uploads
+        # streamed block by block never sit in memory whole
+        in_flight = threading.BoundedSemaphore(llm_workers * 2)
+        
+        with ThreadPoolExecutor(max_workers=extraction_workers) as extract_pool, \
+                ThreadPoolExecutor(max_workers=llm_workers) as llm_pool:
+            pending = {
+                extract_pool.submit(self._submit_file_checks, f, processor, custom_prompt, llm_pool, in_flight): (file_index, None)
+                for file_index, f in enumerate(files)
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_index, slot = pending.pop(future)
+                    if slot is None:
+                        try:
+                            planned, skipped = future.result()
+                        except Exception as e:
+                            yield {"source_file": names[file_index], "file_index": file_index, "results": [], "error": str(e)}
+                            continue
+                        if not planned:
+                            if skipped:
+                                result = self._prefiltered_result(skipped)
+                                result.update(source_file=names[file_index], chunk_index=0)
+                                yield {"source_file": names[file_index], "file_index": file_index, "results": [result], "error": None}
+                            else:
+                                yield {"source_file": names[file_index], "file_index": file_index, "results": [], "error": "No text could be extracted."}
+                            continue
+                        results[file_index] = [None] * len(planned)
+                        remaining[file_index] = len(planned)
+                        for position, (i, chunk_future) in enumerate(planned):
+                            pending[chunk_future] = (file_index, (position, i))
+                        continue
+                    
+                    position, chunk_index = slot
+                    result = future.result()
+                    result["source_file"] = names[file_index]
+                    result["chunk_index"] = chunk_index
+                    results[file_index][position] = result
+                    remaining[file_index] -= 1
+                    if remaining[file_index] == 0:
+                        yield {"source_file": names[file_index], "file_index": file_index, "results": results.pop(file_index), "error": None}
+
+    def _submit_file_checks(self, f: Any, processor: DocumentProcessor, custom_prompt: Optional[str],
+                            llm_pool: ThreadPoolExecutor, in_flight: threading.BoundedSemaphore) -> Tuple[List[Tuple[int, Future]], int]:
+        # Runs on the extraction pool and queues each chunk check as soon as it is cut.
+        # Findings are located against the whole document, so the pre-filter and PII
+        # detectors still extract it in one piece.
+        if self.prefilter or self.detect_pii:
+            planned, skipped = self._plan_chunks(processor.extract_text(f))
+        else:
+            planned = ((i, chunk, None) for i, chunk in enumerate(self.iter_chunks(processor.iter_document_blocks(f))))
+            skipped = 0
+        submitted = []
+        for i, chunk, findings in planned:
+            in_flight.acquire()
+            chunk_future = llm_pool.submit(self._check_chunk_safely, chunk, custom_prompt, findings)
+            chunk_future.add_done_callback(lambda _: in_flight.release())
+            submitted.append((i, chunk_future))
+        return submitted, skipped
+
+    def _check_chunk_safely(self, chunk: str, custom_prompt: str = None, findings: Optional[List[Dict]] = None) -> Dict:
+        
+        try:
+            return self._check_chunk(chunk, custom_prompt, findings)
+        except Exception as e:
+            return {
+                "compliance_summary": "Error: The compliance check failed for this section. Treating as non-compliant.",
+                "approvals": [],
+                "violations": [f"Compliance check failed: {str(e)}"],
+                "error": str(e)
+            }
+
+    def aggregate_report(self, file_results: Iterable[Dict]) -> Dict:
+        # Per-file totals plus one flat, provenance-tagged result list in upload order
+        files = []
         results = []
+        for file_result in sorted(file_results, key=lambda r: r["file_index"]):
+            violations = sum(self._count_points(r.get("violations")) for r in file_result["results"])
+            approvals = sum(self._count_points(r.get("approvals")) for r in file_result["results"])
+            files.append({
+                "source_file": file_result["source_file"],
+                "chunks_checked": sum(1 for r in file_result["results"] if not r.get("prefiltered")),
+                "sections_skipped": sum(r.get("sections_skipped", 0) for r in file_result["results"]),
+                "total_violations": violations,
+                "total_approvals": approvals,
+                "error": file_result["error"]
+            })
+            results.extend(file_result["results"])
+        total_violations = sum(f["total_violations"] for f in files)
+        return {
+            "domain": self.domain,
+            "files": files,
+            "results": results,
+            "total_violations": total_violations,
+            "total_approvals": sum(f["total_approvals"] for f in files),
+            "files_failed": [f["source_file"] for f in files if f["error"]],
+            "overall_status": self.overall_status(total_violations, sum(f["chunks_checked"] for f in files))
+        }
+
+    def overall_status(self, total_violations: int, chunks_checked: int) -> str:
+        # No violations only means compliant if the LLM actually reviewed something
+        if chunks_checked == 0:
+            return "Not Reviewed"
+        if total_violations == 0:
+            return "Compliant"
+        return "Non-Compliant" if total_violations > 3 else "Needs Review"
+
+    def _count_points(self, points) -> int:
+        
+        if not points:
+            return 0
+        return len(points) if isinstance(points, list) else 1
+
+    async def acheck_compliance(self, text: Union[str, Iterable[str]], custom_prompt: str = None, max_concurrency: Optional[int] = None) -> List[Dict]:
+        # Same results as check_compliance, with every chunk awaited on one event loop instead of a thread each
+        return await gather_bounded(
+            lambda chunk: self._acheck_chunk(chunk, custom_prompt),
+            self.iter_chunks(text),
+            max_concurrency
+        )
+
+    async def _acheck_chunk(self, chunk: str, custom_prompt: str = None) -> Dict:
+        
+        stored = self._stored_result(chunk, custom_prompt)
+        if stored is not None:
+            return self._apply_findings(stored, chunk)
+        llm_response = await self.async_llm.agenerate(self.chunk_prompt(chunk, custom_prompt), json_mode=True)
+        return self._apply_findings(self._parse_and_store(llm_response, chunk, custom_prompt), chunk)
+
+    def chunk_prompt(self, chunk: str, custom_prompt: str = None) -> str:
+        # The exact prompt sent for one chunk; also used to build batch API requests
+        if custom_prompt:
+            return f"{custom_prompt}\n\nPlease output ONLY valid JSON in the following format (no explanation):\n{{\n  \"compliance_summary\": \"<summary>\",\n  \"approvals\": [\"<point1>\", \"<point2>\"],\n  \"violations\": [\"<violation1>\", \"<violation2>\"]\n}}\n\nDocument to analyze:\n{chunk}"
+        return self.build_prompt(chunk)
+
+    def _check_chunk(self, chunk: str, custom_prompt: str = None, findings: Optional[List[Dict]] = None) -> Dict:
+        
+        stored = self._stored_result(chunk, custom_prompt)
+        if stored is not None:
+            return self._apply_findings(stored, chunk, findings)
+        llm_response = self.llm.generate(self.chunk_prompt(chunk, custom_prompt), json_mode=True)
+        return self._apply_findings(self._parse_and_store(llm_response, chunk, custom_prompt), chunk, findings)
+
+    def _result_key(self, chunk: str, custom_prompt: str = None) -> Tuple[str, str, str, str]:
+        # The prompt is hashed without the chunk, so a changed template or custom prompt
+        # invalidates every stored verdict while the chunk text is matched on its own
+        return content_hash(chunk), content_hash(self.chunk_prompt("", custom_prompt)), self.model, self.domain
+
+    def _stored_result(self, chunk: str, custom_prompt: str = None) -> Optional[Dict]:
         
-        for chunk in chunks:
-            if custom_prompt:
-                prompt = f"{custom_prompt}\n\nPlease output ONLY valid JSON in the following format (no explanation):\n{{\n  \"compliance_summary\": \"<summary>\",\n  \"approvals\": [\"<point1>\", \"<point2>\"],\n  \"violations\": [\"<violation1>\", \"<violation2>\"]\n}}\n\nDocument to analyze:\n{chunk}"
-            else:
-                prompt = self.build_prompt(chunk)
-            
-            llm_response = self.llm.generate(prompt)
-            
-            json_str = self._extract_json(llm_response)
-            try:
-                parsed = json.loads(json_str)
-            except Exception as e:
-                parsed = {
-                    "compliance_summary": "Parsing Error: The LLM did not return valid JSON. Treating as non-compliant.",
-                    "approvals": [],
-                    "violations": [
-                        f"LLM output could not be parsed as JSON. Raw output: {llm_response[:200]}...",
-                        f"Parsing error: {str(e)}"
-                    ],
-                    "raw_output": llm_response,
-                    "parsing_error": str(e)
-                }
-            if self.rules:
-                parsed = self.cross_reference_rules(parsed, chunk)
-            results.append(parsed)
-        return results
-
-    def cross_reference_rules(self, llm_output: Dict, chunk: str) -> Dict:
+        if not self.incremental:
+            return None
+        return self.result_store.get(*self._result_key(chunk, custom_prompt))
+
+    def _parse_and_store(self, llm_response: str, chunk: str, custom_prompt: str = None) -> Dict:
+        # Only the LLM's verdict is stored; rule findings carry document offsets and are
+        # re-applied on every run. Unparseable output is not kept, so it is retried next time.
+        parsed = self._parse_llm_output(llm_response)
+        if self.incremental and "parsing_error" not in parsed:
+            self.result_store.set(*self._result_key(chunk, custom_prompt), parsed)
+        return parsed
+
+    def parse_chunk_response(self, llm_response: str, chunk: str, findings: Optional[List[Dict]] = None) -> Dict:
+        # Turns a raw model answer for one chunk into the per-chunk result dict
+        return self._apply_findings(self._parse_llm_output(llm_response), chunk, findings)
+
+    def _apply_findings(self, parsed: Dict, chunk: str, findings: Optional[List[Dict]] = None) -> Dict:
+        
+        if self.rules or findings is not None:
+            parsed = self.cross_reference_rules(parsed, chunk, findings)
+        return parsed
+
+    def _parse_llm_output(self, llm_response: str) -> Dict:
+        
+        try:
+            # Repairs common defects and checks the expected fields before giving up
+            parsed = parse_llm_json(llm_response, COMPLIANCE_SCHEMA)
+        except Exception as e:
+            parsed = {
+                "compliance_summary": "Parsing Error: The LLM did not return valid JSON. Treating as non-compliant.",
+                "approvals": [],
+                "violations": [
+                    f"LLM output could not be parsed as JSON. Raw output: {llm_response[:200]}...",
+                    f"Parsing error: {str(e)}"
+                ],
+                "raw_output": llm_response,
+                "parsing_error": str(e)
+            }
+        return parsed
+
+    def cross_reference_rules(self, llm_output: Dict, chunk: str, findings: Optional[List[Dict]] = None) -> Dict:
         #Cross-referencing LLM output
         
-        llm_output['rules_checked'] = [rule.get('name') for rule in self.rules]
+        rules = self.rules if findings is None else self.rule_engine.rules
+        llm_output['rules_checked'] = [rule.get('name') for rule in rules]
+        if findings:
+            # Deterministic rule hits are added as violations alongside the LLM's own
+            violations = llm_output.get('violations') or []
+            if not isinstance(violations, list):
+                violations = [violations]
+            for finding in findings:
+                if finding['kind'] == 'violation':
+                    entry = f"{finding['rule']} detected: {finding['match']}"
+                    if entry not in violations:
+                        violations.append(entry)
+            llm_output['violations'] = violations
+            llm_output['rule_findings'] = findings
         return llm_output
 
     def save_report(self, report: List[Dict], filename: str = "compliance_report.json"):
@@ -0,0 +1,231 @@
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from config import OPENAI_CONFIG, PERFORMANCE_CONFIG
+from llm_clients import get_openai_client
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchBackend(ABC):
+    # A provider batch API: submit a list of chat requests, poll, then read results back
+
+    @abstractmethod
+    def submit(self, requests: List[Dict]) -> str:
+        ...
+
+    @abstractmethod
+    def status(self, job_id: str) -> Dict:
+        ...
+
+    @abstractmethod
+    def results(self, job_id: str) -> Iterator[Dict]:
+        # Yields {"custom_id", "content", "error"} per request
+        ...
+
+
+class OpenAIBatchBackend(BatchBackend):
+
+    def __init__(self, api_key: Optional[str] = None, completion_window: Optional[str] = None, client=None):
+        self.client = client or get_openai_client(api_key or os.getenv("OPENAI_API_KEY"))
+        self.completion_window = completion_window or PERFORMANCE_CONFIG["batch_completion_window"]
+
+    def submit(self, requests: List[Dict]) -> str:
+        payload = "".join(json.dumps(request, ensure_ascii=False) + "\n" for request in requests)
+        upload = self.client.files.create(file=("compliance_batch.jsonl", payload.encode("utf-8")), purpose="batch")
+        # The pinned SDK predates client.batches, so the endpoint is called directly
+        job = self.client.post("/batches", cast_to=Dict[str, Any], body={
+            "input_file_id": upload.id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": self.completion_window
+        })
+        return job["id"]
+
+    def status(self, job_id: str) -> Dict:
+        return self.client.get(f"/batches/{job_id}", cast_to=Dict[str, Any])
+
+    def results(self, job_id: str) -> Iterator[Dict]:
+        job = self.status(job_id)
+        for file_id in (job.get("output_file_id"), job.get("error_file_id")):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    yield self._parse_line(json.loads(line))
+
+    def _parse_line(self, line: Dict) -> Dict:
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        error = line.get("error")
+        content = ""
+        if response.get("status_code") == 200 and body.get("choices"):
+            content = (body["choices"][0]["message"]["content"] or "").strip()
+        elif not error:
+            error = body.get("error") or f"HTTP {response.get('status_code')}"
+        return {"custom_id": line.get("custom_id"), "content": content, "error": error}
+
+
+class LocalBatchBackend(BatchBackend):
+    # In-process stand-in for a provider batch API, used by tests and dry runs
+
+    def __init__(self, generate: Callable[[str], str], polls_until_complete: int = 1):
+        self.generate = generate
+        self.polls_until_complete = polls_until_complete
+        self.jobs: Dict[str, Dict] = {}
+
+    def submit(self, requests: List[Dict]) -> str:
+        job_id = f"batch_{uuid.uuid4().hex[:12]}"
+        self.jobs[job_id] = {"requests": list(requests), "polls": 0}
+        return job_id
+
+    def status(self, job_id: str) -> Dict:
+        job = self.jobs[job_id]
+        job["polls"] += 1
+        status = "completed" if job["polls"] >= self.polls_until_complete else "in_progress"
+        return {"id": job_id, "status": status, "request_counts": {"total": len(job["requests"])}}
+
+    def results(self, job_id: str) -> Iterator[Dict]:
+        for request in self.jobs[job_id]["requests"]:
+            try:
+                content = self.generate(request["body"]["messages"][0]["content"])
+                yield {"custom_id": request["custom_id"], "content": content, "error": None}
+            except Exception as e:
+                yield {"custom_id": request["custom_id"], "content": "", "error": str(e)}
+
+
+class ComplianceBatchRunner:
+    # Offline sweep: chunk every document, push all chunk prompts through a batch job,
+    # then rebuild per-document reports in chunk order
+
+    def __init__(self, agent, backend: BatchBackend, batch_dir: Optional[str] = None,
+                 poll_interval: Optional[float] = None, max_requests_per_batch: Optional[int] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.agent = agent
+        self.backend = backend
+        self.batch_dir = batch_dir
+        self.poll_interval = poll_interval if poll_interval is not None else PERFORMANCE_CONFIG["batch_poll_interval"]
+        self.max_requests_per_batch = max_requests_per_batch or PERFORMANCE_CONFIG["batch_max_requests"]
+        self.sleep = sleep
+        self._chunks: Dict[str, str] = {}
+        self._submitted: Dict[str, List[str]] = {}
+
+    def build_requests(self, documents: Dict[str, str], custom_prompt: str = None) -> Iterator[Dict]:
+
+        for doc_id, text in documents.items():
+            for chunk_index, chunk in enumerate(self.agent.iter_chunks(text)):
+                custom_id = f"{doc_id}::{chunk_index}"
+                self._chunks[custom_id] = chunk
+                body = {
+                    "model": self.agent.model,
+                    "messages": [{"role": "user", "content": self.agent.chunk_prompt(chunk, custom_prompt)}],
+                    "max_tokens": 1024,
+                    "temperature": 0.5
+                }
+                if self.agent.model in OPENAI_CONFIG["json_mode_models"]:
+                    body["response_format"] = {"type": "json_object"}
+                yield {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+    def submit(self, documents: Dict[str, str], custom_prompt: str = None) -> List[str]:
+
+        job_ids = []
+        batch = []
+        for request in self.build_requests(documents, custom_prompt):
+            batch.append(request)
+            if len(batch) >= self.max_requests_per_batch:
+                job_ids.append(self._submit_batch(batch))
+                batch = []
+        if batch:
+            job_ids.append(self._submit_batch(batch))
+        return job_ids
+
+    def _submit_batch(self, batch: List[Dict]) -> str:
+
+        job_id = self.backend.submit(batch)
+        self._submitted[job_id] = [request["custom_id"] for request in batch]
+        if self.batch_dir:
+            # Keep the submitted file next to the job id for auditing and resubmission
+            os.makedirs(self.batch_dir, exist_ok=True)
+            with open(os.path.join(self.batch_dir, f"{job_id}.jsonl"), "w", encoding="utf-8") as f:
+                for request in batch:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        return job_id
+
+    def wait(self, job_ids: Iterable[str], timeout: Optional[float] = None) -> Dict[str, Dict]:
+
+        pending = list(job_ids)
+        statuses = {}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending:
+            for job_id in list(pending):
+                status = self.backend.status(job_id)
+                if status.get("status") in TERMINAL_STATUSES:
+                    statuses[job_id] = status
+                    pending.remove(job_id)
+            if not pending:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Exception(f"Batch jobs still running after {timeout}s: {', '.join(pending)}")
+            self.sleep(self.poll_interval)
+        return statuses
+
+    def collect(self, job_ids: Iterable[str], statuses: Optional[Dict[str, Dict]] = None) -> Dict[str, List[Dict]]:
+        # Every submitted chunk gets an entry, so a failed, expired or cancelled job reports its
+        # missing chunks as batch errors instead of dropping them, and list positions stay
+        # equal to chunk indices
+        statuses = statuses or {}
+        reports: Dict[str, Dict[int, Dict]] = {}
+        for job_id in job_ids:
+            for result in self.backend.results(job_id):
+                doc_id, _, chunk_index = result["custom_id"].rpartition("::")
+                chunk = self._chunks.get(result["custom_id"], "")
+                if result.get("error"):
+                    parsed = self._batch_error(result["error"])
+                else:
+                    parsed = self.agent.parse_chunk_response(result["content"], chunk)
+                reports.setdefault(doc_id, {})[int(chunk_index)] = parsed
+            
+            missing = []
+            for custom_id in self._submitted_ids(job_id):
+                doc_id, _, chunk_index = custom_id.rpartition("::")
+                if int(chunk_index) not in reports.get(doc_id, {}):
+                    missing.append((doc_id, int(chunk_index)))
+            if missing:
+                reason = self._job_failure(statuses.get(job_id) or self.backend.status(job_id))
+                for doc_id, chunk_index in missing:
+                    reports.setdefault(doc_id, {})[chunk_index] = self._batch_error(reason)
+        return {doc_id: [chunks[i] for i in sorted(chunks)] for doc_id, chunks in reports.items()}
+
+    def _submitted_ids(self, job_id: str) -> List[str]:
+        # Falls back to the saved request file when the job was submitted by another runner
+        if job_id in self._submitted:
+            return self._submitted[job_id]
+        if self.batch_dir:
+            path = os.path.join(self.batch_dir, f"{job_id}.jsonl")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    return [json.loads(line)["custom_id"] for line in f if line.strip()]
+        return []
+
+    def _job_failure(self, status: Dict) -> str:
+
+        messages = [error.get("message", "") for error in ((status.get("errors") or {}).get("data") or [])]
+        reason = f"batch job {status.get('status', 'unknown')} without a result for this request"
+        return f"{reason}: {'; '.join(messages)}" if any(messages) else reason
+
+    def _batch_error(self, error: Any) -> Dict:
+
+        return {
+            "compliance_summary": "Batch Error: The request failed. Treating as non-compliant.",
+            "approvals": [],
+            "violations": [f"Batch request failed: {error}"],
+            "batch_error": str(error)
+        }
+
+    def run(self, documents: Dict[str, str], custom_prompt: str = None, timeout: Optional[float] = None) -> Dict[str, List[Dict]]:
+
+        job_ids = self.submit(documents, custom_prompt)
+        statuses = self.wait(job_ids, timeout)
+        return self.collect(job_ids, statuses)
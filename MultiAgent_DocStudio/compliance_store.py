@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from config import PERFORMANCE_CONFIG, STORAGE_CONFIG
+
+
+def content_hash(text: str) -> str:
+    # Whitespace is normalised so re-extracting the same text (PDF line wrapping) still matches
+    return hashlib.sha256(" ".join(text.split()).encode('utf-8')).hexdigest()
+
+
+class ComplianceResultStore:
+    # Parsed per-chunk LLM verdicts keyed by (chunk hash, prompt hash, model, domain), kept
+    # without expiry so each revision of a document only pays for the chunks it changed
+
+    def __init__(self, db_file: Optional[str] = None):
+        if db_file is None:
+            # Lives alongside the summaries database
+            db_dir = os.path.dirname(STORAGE_CONFIG["database_file"])
+            db_file = os.path.join(db_dir, PERFORMANCE_CONFIG["result_store_file"])
+        self.db_file = db_file
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._init_database()
+
+    def _init_database(self):
+
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS chunk_results (
+                    chunk_hash TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    domain TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (chunk_hash, prompt_hash, model, domain)
+                )
+            ''')
+            self._conn.commit()
+
+    def get(self, chunk_hash: str, prompt_hash: str, model: str, domain: str) -> Optional[Dict]:
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT result FROM chunk_results WHERE chunk_hash = ? AND prompt_hash = ? AND model = ? AND domain = ?',
+                (chunk_hash, prompt_hash, model, domain)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, chunk_hash: str, prompt_hash: str, model: str, domain: str, result: Dict):
+
+        with self._lock:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO chunk_results (chunk_hash, prompt_hash, model, domain, result, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (chunk_hash, prompt_hash, model, domain, json.dumps(result, ensure_ascii=False), time.time()))
+            self._conn.commit()
+
+    def clear(self):
+
+        with self._lock:
+            self._conn.execute('DELETE FROM chunk_results')
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict:
+
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM chunk_results').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+
+_shared_store: Optional[ComplianceResultStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_result_store() -> ComplianceResultStore:
+    # One store per process so counters survive Streamlit reruns
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = ComplianceResultStore()
+        return _shared_store
@@ -15,7 +15,8 @@ OPENAI_CONFIG = {
     "temperature": 0.3,
     "top_p": 0.9,
     "timeout": 30, 
-    "retry_attempts": 3
+    "retry_attempts": 3,
+    "json_mode_models": ["gpt-3.5-turbo", "gpt-4-turbo-preview"]  # models accepting response_format=json_object
 }
 
 # Summary Configuration
@@ -34,6 +35,28 @@ SUMMARY_CONFIG = {
     "tolerance_percentage": 20 
 }
 
+# Chunking Configuration
+CHUNK_CONFIG = {
+    "context_windows": {
+        "gpt-3.5-turbo": 16385,
+        "gpt-4": 8192,
+        "gpt-4-turbo-preview": 128000,
+        "gemini-2.5-flash": 1048576
+    },
+    "default_context_window": 4096,
+    "default_encoding": "cl100k_base",
+    "prompt_overhead_tokens": 500,
+    "response_tokens": 1024,
+    "compliance_chunk_tokens": 1500,
+    "overlap_tokens": 100,
+    "section_summary_tokens": 512,
+    "reduce_fan_in": 8,
+    # Content-defined chunking (incremental re-checks): a chunk of at least
+    # min_chunk_fraction * max tokens ends at roughly one sentence in boundary_divisor
+    "min_chunk_fraction": 0.5,
+    "boundary_divisor": 8
+}
+
 # File Processing Configuration
 FILE_CONFIG = {
     "supported_formats": {
@@ -52,7 +75,15 @@ FILE_CONFIG = {
     "max_file_size_mb": 50,
     "encoding_fallback": "latin-1",
     "excel_max_rows": 20,  
-    "csv_max_rows": 20
+    "csv_max_rows": 20,
+    "extraction_cache_enabled": True,
+    "extraction_cache_dir": ".extraction_cache",
+    "extraction_cache_max_mb": 500,
+    "pdf_parallel_min_pages": 64,
+    "pdf_max_workers": None,  # process-wide cap; defaults to the CPU count
+    "pdf_process_start_method": "spawn",  # never fork the multi-threaded app process
+    "text_block_size_kb": 256,
+    "encoding_detect_bytes": 65536
 }
 
 # Storage Configuration
@@ -61,10 +92,18 @@ STORAGE_CONFIG = {
     "storage_options": ["JSON", "CSV", "SQLite Database"],
     "database_file": "summaries.db",
     "json_file": "summaries.json",
+    "jsonl_file": "summaries.jsonl",
     "csv_file": "summaries.csv",
     "backup_enabled": True,
     "backup_interval": 7,  # days
-    "max_backups": 5
+    "max_backups": 5,
+    "sqlite_pool_size": 8,
+    "sqlite_busy_timeout_ms": 5000,
+    "sqlite_cache_size_kb": 20000,
+    "write_batch_size": 100,
+    "write_flush_interval": 2.0,  # seconds
+    "export_batch_size": 1000,
+    "export_parquet_compression": "zstd"
 }
 
 # UI Configuration
@@ -132,6 +171,7 @@ COST_CONFIG = {
 ERROR_CONFIG = {
     "max_retries": 3,
     "retry_delay": 1, 
+    "retry_max_delay": 30,  # seconds
     "show_detailed_errors": True,
     "log_errors": True,
     "error_log_file": "error.log"
@@ -141,9 +181,35 @@ ERROR_CONFIG = {
 PERFORMANCE_CONFIG = {
     "enable_caching": True,
     "cache_ttl": 3600, 
+    "cache_file": "llm_cache.db",
+    "cache_max_size_mb": 100,
+    "cache_access_flush_every": 100,  # cache hits batch their last-access updates
+    "incremental_recheck": False,  # reuse stored results for unchanged chunks of a revised document
+    "result_store_file": "compliance_results.db",
     "max_concurrent_requests": 5,
+    "max_async_requests": 100,
+    "extraction_workers": 4,
+    "batch_poll_interval": 30,  # seconds
+    "batch_max_requests": 50000,
+    "batch_completion_window": "24h",
     "request_timeout": 30,
-    "enable_progress_bars": True
+    "http_max_connections": 20,
+    "http_max_keepalive_connections": 10,
+    "http_keepalive_expiry": 60,  # seconds
+    "rate_limits": {
+        "openai": {"requests_per_minute": 500, "burst": 20},
+        "gemini": {"requests_per_minute": 60, "burst": 10}
+    },
+    "enable_progress_bars": True,
+    "token_count_cache_size": 256,
+    "exact_token_count_max_chars": 500000,
+    "estimated_chars_per_token": 4
+}
+
+# Rule pre-filter Configuration
+RULE_CONFIG = {
+    "prefilter_enabled": False,  # only escalate chunks with rule findings to the LLM
+    "pii_detectors_enabled": False  # batch-scan chunks for PII/PHI/PCI identifiers
 }
 
 # Security Configuration
@@ -160,12 +226,14 @@ def get_config() -> Dict:
     return {
         "openai": OPENAI_CONFIG,
         "summary": SUMMARY_CONFIG,
+        "chunking": CHUNK_CONFIG,
         "file": FILE_CONFIG,
         "storage": STORAGE_CONFIG,
         "ui": UI_CONFIG,
         "cost": COST_CONFIG,
         "error": ERROR_CONFIG,
         "performance": PERFORMANCE_CONFIG,
+        "rules": RULE_CONFIG,
         "security": SECURITY_CONFIG
     }
 
@@ -207,6 +275,9 @@ def validate_config() -> List[str]:
             errors.append(f"Word limits for {length} are invalid: min >= max")
     
     
+    if CHUNK_CONFIG["overlap_tokens"] * 2 >= CHUNK_CONFIG["compliance_chunk_tokens"]:
+        errors.append("Chunk overlap must be less than half of the compliance chunk size")
+    
     if FILE_CONFIG["max_file_size_mb"] <= 0:
         errors.append("Max file size must be positive")
   
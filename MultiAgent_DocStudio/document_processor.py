@@ -1,12 +1,102 @@
 import fitz  # PyMuPDF
 import pandas as pd
 from docx import Document
+import codecs
 import io
-import re
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from config import FILE_CONFIG
+from extraction_cache import ExtractionCache
+
+# Bump whenever extractor output changes so cached text is invalidated
+EXTRACTOR_VERSION = "4"
+
+# Structural markers kept in cleaned text so chunkers can split on real boundaries
+PAGE_BREAK = '\f'
+PAGE_MARKER = "[Page {page}]"
+TABLE_START_MARKER = "[Table]"
+TABLE_END_MARKER = "[End Table]"
+
+def _extract_pdf_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    # Runs in a worker process; each worker opens its own handle on the file
+    pdf_document = fitz.open(pdf_path)
+    try:
+        return [pdf_document.load_page(page_num).get_text() for page_num in range(start, end)]
+    finally:
+        pdf_document.close()
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+def _pdf_pool_size() -> int:
+    
+    return max(1, FILE_CONFIG["pdf_max_workers"] or os.cpu_count() or 1)
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    # One pool per process, so concurrent extraction threads share the same worker cap.
+    # Workers are spawned rather than forked: the app process runs Streamlit, SQLite and
+    # extraction threads, and forking a multi-threaded process can deadlock.
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            context = multiprocessing.get_context(FILE_CONFIG["pdf_process_start_method"])
+            _pdf_pool = ProcessPoolExecutor(max_workers=_pdf_pool_size(), mp_context=context)
+        return _pdf_pool
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor):
+    # A crashed worker breaks the whole pool; the next extraction starts a fresh one
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+class _BlockCleaner:
+    # Cleans consecutive raw blocks of one stream: page numbering carries across blocks,
+    # and each block after the first is prefixed with the separator its cut removed
+    _SEPARATOR_RANK = {'': 0, ' ': 1, '\n': 2, '\n\n': 3}
+    
+    def __init__(self, clean: Callable[..., str]):
+        self._clean = clean
+        self.page = None
+        self.separator = None
+        self.started = False
+    
+    def clean(self, raw: str, separator_after: str) -> str:
+        
+        block = self._clean(raw, start_page=self.page)
+        self.page = (self.page or 1) + raw.count(PAGE_BREAK)
+        if block:
+            if self.started:
+                block = (self.separator or '') + block
+            self.started = True
+            self.separator = separator_after
+        elif self.started:
+            # An all-whitespace block between two cuts keeps the stronger separator
+            self.separator = max(self.separator or '', separator_after, key=self._SEPARATOR_RANK.get)
+        return block
+
+def get_page_for_offset(page_offsets: List[List[int]], offset: int) -> Optional[int]:
+    
+    starts = [start for start, _ in page_offsets]
+    index = bisect_right(starts, offset) - 1
+    if index < 0:
+        return None
+    return index + 1
 
 class DocumentProcessor:
     
-    def __init__(self):
+    def __init__(self, use_cache: Optional[bool] = None):
+        if use_cache is None:
+            use_cache = FILE_CONFIG["extraction_cache_enabled"]
+        self.cache = ExtractionCache() if use_cache else None
         self.supported_formats = {
             'application/pdf': self._extract_pdf_text,
             'text/plain': self._extract_txt_text,
@@ -19,21 +109,81 @@ class DocumentProcessor:
     
     def extract_text(self, uploaded_file):
        
+        text, _ = self.extract_text_with_metadata(uploaded_file)
+        return text
+    
+    def extract_text_with_metadata(self, uploaded_file) -> Tuple[str, Dict]:
+        
         try:
-           
             file_type = uploaded_file.type
+            cache_key = None
+            if self.cache is not None:
+                cache_key = ExtractionCache.make_key(self._iter_bytes(uploaded_file), file_type or uploaded_file.name, EXTRACTOR_VERSION)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    # The key is the content hash, so the entry may come from another upload
+                    text, metadata = cached
+                    metadata.update(name=uploaded_file.name, type=file_type)
+                    return text, metadata
             
-            
-            if file_type in self.supported_formats:
-                return self.supported_formats[file_type](uploaded_file)
-            else:
-                
-                file_extension = uploaded_file.name.lower().split('.')[-1]
-                return self._extract_by_extension(uploaded_file, file_extension)
+            text, extra_metadata = self._extract(uploaded_file, file_type)
+            metadata = {
+                'name': uploaded_file.name,
+                'type': file_type,
+                'extractor_version': EXTRACTOR_VERSION,
+                'char_count': len(text),
+                'extracted_at': time.time()
+            }
+            metadata.update(extra_metadata)
+            if cache_key is not None:
+                self.cache.set(cache_key, text, metadata)
+            return text, metadata
                 
         except Exception as e:
             raise Exception(f"Error extracting text from {uploaded_file.name}: {str(e)}")
     
+    def _extract(self, uploaded_file, file_type) -> Tuple[str, Dict]:
+        
+        file_extension = uploaded_file.name.lower().split('.')[-1]
+        if file_type == 'application/pdf' or (file_type not in self.supported_formats and file_extension == 'pdf'):
+            # PDFs also report where each page starts so later stages can cite pages
+            text, page_offsets = self._extract_pdf(uploaded_file)
+            return text, {'page_count': len(page_offsets), 'page_offsets': page_offsets}
+        if file_type in self.supported_formats:
+            return self.supported_formats[file_type](uploaded_file), {}
+        else:
+            
+            return self._extract_by_extension(uploaded_file, file_extension), {}
+    
+    def _iter_bytes(self, uploaded_file) -> Iterator[bytes]:
+        # Reads the upload block by block and rewinds it, so hashing never copies the whole file
+        block_size = FILE_CONFIG["text_block_size_kb"] * 1024
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+        while True:
+            data = uploaded_file.read(block_size)
+            if not data:
+                break
+            yield data
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+    
+    def is_plain_text(self, uploaded_file) -> bool:
+        
+        file_type = getattr(uploaded_file, 'type', None)
+        if file_type in self.supported_formats:
+            return file_type == 'text/plain'
+        return getattr(uploaded_file, 'name', '').lower().split('.')[-1] == 'txt'
+    
+    def iter_document_blocks(self, uploaded_file) -> Iterator[str]:
+        # Plain text is decoded block by block and never held whole (nor cached, since the
+        # cache stores full text); other formats need the whole file for their parsers and
+        # come through extract_text as a single block
+        if self.is_plain_text(uploaded_file):
+            yield from self.iter_text_blocks(uploaded_file)
+        else:
+            yield self.extract_text(uploaded_file)
+    
     def _extract_by_extension(self, uploaded_file, extension):
         
         extension_mapping = {
@@ -53,47 +203,127 @@ class DocumentProcessor:
     
     def _extract_pdf_text(self, uploaded_file):
        
+        text, _ = self._extract_pdf(uploaded_file)
+        return text
+    
+    def _extract_pdf(self, uploaded_file) -> Tuple[str, List[List[int]]]:
+        
         try:
+            data = uploaded_file.read()
+            pages = None
+            with fitz.open(stream=data, filetype="pdf") as pdf_document:
+                page_count = len(pdf_document)
+                if page_count < FILE_CONFIG["pdf_parallel_min_pages"]:
+                    pages = [pdf_document.load_page(page_num).get_text() for page_num in range(page_count)]
+            if pages is None:
+                # The handle is closed first; workers open their own
+                pages = self._extract_pdf_pages_parallel(data, page_count)
             
-            pdf_document = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-            text = ""
-            
-            
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                text += page.get_text()
-            
-            pdf_document.close()
-            
-            
-            text = self._clean_text(text)
-            return text
+            return self._join_pages([self._clean_text(page) for page in pages])
             
         except Exception as e:
             raise Exception(f"Error extracting PDF text: {str(e)}")
     
+    def _extract_pdf_pages_parallel(self, data: bytes, page_count: int) -> List[str]:
+        # Shard contiguous page ranges across the shared process pool; workers read a temp copy of the file
+        max_workers = max(1, min(_pdf_pool_size(), page_count))
+        shard_size = -(-page_count // max_workers)
+        ranges = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+        
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+            tmp.write(data)
+            pdf_path = tmp.name
+        pool = get_pdf_pool()
+        try:
+            shards = pool.map(_extract_pdf_page_range, [pdf_path] * len(ranges),
+                              [start for start, _ in ranges], [end for _, end in ranges])
+            return [page for shard in shards for page in shard]
+        except BrokenProcessPool:
+            _discard_pdf_pool(pool)
+            raise
+        finally:
+            os.unlink(pdf_path)
+    
+    def _join_pages(self, pages: List[str]) -> Tuple[str, List[List[int]]]:
+        # Same layout _clean_text produces for multi-page input, built with one join
+        if len(pages) == 1:
+            return pages[0], [[0, len(pages[0])]]
+        parts = []
+        page_offsets = []
+        position = 0
+        for page_num, page in enumerate(pages, 1):
+            marker = PAGE_MARKER.format(page=page_num)
+            if parts:
+                position += 2
+            position += len(marker)
+            parts.append(marker)
+            if page:
+                position += 2 + len(page)
+                parts.append(page)
+            page_offsets.append([position - len(page), position])
+        return '\n\n'.join(parts), page_offsets
+    
     def _extract_txt_text(self, uploaded_file):
         
         try:
-          
-            text = uploaded_file.read().decode('utf-8')
-            
-           
-            text = self._clean_text(text)
-            return text
-            
-        except UnicodeDecodeError:
-           
-            try:
-                uploaded_file.seek(0) 
-                text = uploaded_file.read().decode('latin-1')
-                text = self._clean_text(text)
-                return text
-            except Exception as e:
-                raise Exception(f"Error decoding text file: {str(e)}")
+            return "".join(self.iter_text_blocks(uploaded_file))
         except Exception as e:
             raise Exception(f"Error extracting text file: {str(e)}")
     
+    def _detect_encoding(self, prefix: bytes) -> str:
+        
+        if prefix.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        try:
+            # final=False tolerates a multi-byte character cut off at the end of the prefix
+            codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            return FILE_CONFIG["encoding_fallback"]
+    
+    def iter_text_blocks(self, uploaded_file, block_size: Optional[int] = None) -> Iterator[str]:
+        # Decodes the upload incrementally and yields cleaned blocks cut at paragraph
+        # breaks, so memory stays proportional to the block size rather than the file.
+        # Every block after the first starts with the separator it was cut at, so
+        # "".join(blocks) is the cleaned text without invented paragraph breaks.
+        block_size = block_size or FILE_CONFIG["text_block_size_kb"] * 1024
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+        prefix = uploaded_file.read(FILE_CONFIG["encoding_detect_bytes"])
+        encoding = self._detect_encoding(prefix)
+        # The encoding was chosen from the prefix; a stray bad byte later on is replaced, not fatal
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        
+        pending = decoder.decode(prefix)
+        cleaner = _BlockCleaner(self._clean_text)
+        while True:
+            data = uploaded_file.read(block_size)
+            if not data:
+                break
+            pending += decoder.decode(data)
+            if len(pending) < block_size:
+                continue
+            cut = pending.rfind('\n\n')
+            separator = '\n\n'
+            if cut <= 0 and len(pending) >= 4 * block_size:
+                # No paragraph break within the limit: fall back to a line break, then a
+                # space, then a hard cut, so a file without newlines cannot grow pending
+                cut, separator = pending.rfind('\n'), '\n'
+                if cut <= 0:
+                    cut, separator = pending.rfind(' '), ' '
+                if cut <= 0:
+                    cut, separator = len(pending), ''
+            if cut <= 0:
+                continue
+            block = cleaner.clean(pending[:cut], separator)
+            pending = pending[cut:]
+            if block:
+                yield block
+        pending += decoder.decode(b'', final=True)
+        block = cleaner.clean(pending, '')
+        if block:
+            yield block
+    
     def _extract_excel_text(self, uploaded_file):
         
         try:
@@ -174,32 +404,54 @@ class DocumentProcessor:
             
         
             for table in doc.tables:
-                text_parts.append("\nTable:")
+                table_lines = [TABLE_START_MARKER]
                 for row in table.rows:
                     row_text = []
                     for cell in row.cells:
                         row_text.append(cell.text.strip())
-                    text_parts.append(" | ".join(row_text))
+                    table_lines.append(" | ".join(row_text))
+                table_lines.append(TABLE_END_MARKER)
+                text_parts.append("\n".join(table_lines))
             
-            text = "\n".join(text_parts)
+            text = "\n\n".join(text_parts)
             text = self._clean_text(text)
             return text
             
         except Exception as e:
             raise Exception(f"Error extracting Word document text: {str(e)}")
     
-    def _clean_text(self, text):
-        
+    def _clean_text(self, text, preserve_structure=True, start_page=None):
+        # start_page marks text that continues that page of a longer stream: its page
+        # markers carry on from there and no marker is added for the page it opens on
         if not text:
             return ""
         
-        text = re.sub(r'\s+', ' ', text)
-        
-        text = re.sub(r'\n\s*\n', '\n\n', text)
+        if not preserve_structure:
+            return ' '.join(text.split())
         
-        text = text.strip()
+        # One walk over the text: collapse whitespace inside each line, turn blank
+        # lines into paragraph breaks and form feeds into page markers.
+        paragraphs = []
+        current = []
+        pages = text.split(PAGE_BREAK)
+        first_page = start_page or 1
+        for index, page in enumerate(pages):
+            if index > 0 or (start_page is None and len(pages) > 1):
+                if current:
+                    paragraphs.append('\n'.join(current))
+                    current = []
+                paragraphs.append(PAGE_MARKER.format(page=first_page + index))
+            for line in page.split('\n'):
+                line = ' '.join(line.split())
+                if line:
+                    current.append(line)
+                elif current:
+                    paragraphs.append('\n'.join(current))
+                    current = []
+        if current:
+            paragraphs.append('\n'.join(current))
         
-        return text
+        return '\n\n'.join(paragraphs)
     
     def get_file_info(self, uploaded_file):
         try:
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional, Tuple, Union
+from config import FILE_CONFIG
+
+class ExtractionCache:
+    
+    def __init__(self, cache_dir: Optional[str] = None, max_size_mb: Optional[float] = None):
+        self.cache_dir = cache_dir or FILE_CONFIG["extraction_cache_dir"]
+        max_size_mb = FILE_CONFIG["extraction_cache_max_mb"] if max_size_mb is None else max_size_mb
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(data: Union[bytes, Iterable[bytes]], file_type: str, extractor_version: str) -> str:
+        # data may be a stream of byte blocks, so large uploads are hashed without a full copy
+        digest = hashlib.sha256()
+        digest.update(f"{extractor_version}:{file_type}:".encode('utf-8'))
+        for block in ([data] if isinstance(data, (bytes, bytearray)) else data):
+            digest.update(block)
+        return digest.hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def get(self, key: str) -> Optional[Tuple[str, Dict]]:
+        
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            text, metadata = entry['text'], dict(entry['metadata'])
+        except (OSError, ValueError, KeyError, TypeError):
+            # Unreadable or malformed entries are misses; the next set() overwrites them
+            return None
+        # mtime doubles as the last-access time for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return text, metadata
+    
+    def set(self, key: str, text: str, metadata: Dict):
+        
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'text': text, 'metadata': metadata}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+    
+    def _evict(self):
+        # Oldest-accessed entries go first once the directory exceeds its size cap
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            if total <= self.max_size_bytes:
+                return
+            for _, size, path in sorted(entries):
+                if total <= self.max_size_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+    
+    def clear(self):
+        
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    os.remove(entry.path)
@@ -0,0 +1,162 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+COMPLIANCE_SCHEMA = {
+    "compliance_summary": {"type": str, "required": True},
+    "approvals": {"type": list, "required": False},
+    "violations": {"type": list, "required": False}
+}
+
+_CLOSERS = {"{": "}", "[": "]"}
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+class IncrementalJSONExtractor:
+    # Finds the first balanced top-level JSON object in a stream of text deltas. Braces
+    # inside strings are ignored, so nested objects and "}" in values are handled, and
+    # the object is available as soon as its closing brace arrives.
+
+    def __init__(self):
+        self.buffer: List[str] = []
+        self.stack: List[str] = []
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+
+    def feed(self, delta: str) -> bool:
+        # Returns True once the object is complete; later deltas are ignored
+        for char in delta:
+            if self.complete:
+                break
+            if not self.started:
+                if char != "{":
+                    continue
+                self.started = True
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in _CLOSERS:
+                self.stack.append(_CLOSERS[char])
+            elif char in "}]" and self.stack:
+                if self.stack[-1] == char:
+                    self.stack.pop()
+                if not self.stack:
+                    self.complete = True
+        return self.complete
+
+    def text(self) -> str:
+        # The object so far; a truncated stream is closed off so repair can still parse it
+        text = "".join(self.buffer)
+        if self.complete or not self.started:
+            return text
+        if self.in_string:
+            text += '"'
+        return text + "".join(reversed(self.stack))
+
+
+def extract_json_text(text: str) -> str:
+
+    extractor = IncrementalJSONExtractor()
+    extractor.feed(text)
+    return extractor.text() if extractor.started else text.strip()
+
+
+def repair_json(text: str) -> str:
+    # Fixes the defects LLMs commonly produce: smart quotes, single-quoted strings,
+    # Python literals, trailing commas and raw newlines inside strings
+    text = text.translate(_SMART_QUOTES)
+    out = []
+    i = 0
+    quote = None
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\" and i + 1 < len(text):
+                # \' is not a valid JSON escape
+                out.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                i += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+            i += 1
+            continue
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char == ",":
+            rest = text[i + 1:].lstrip()
+            if not rest or rest[0] not in "}]":
+                out.append(char)
+        else:
+            literal = re.match(r"True|False|None", text[i:])
+            if literal and (i == 0 or not text[i - 1].isalnum()):
+                out.append(_PYTHON_LITERALS[literal.group()])
+                i += literal.end()
+                continue
+            out.append(char)
+        i += 1
+    if quote:
+        out.append('"')
+    return "".join(out)
+
+
+def validate_schema(data: Any, schema: Dict[str, Dict]) -> Tuple[Dict, List[str]]:
+    # Coerces what can be coerced (a lone string where a list is expected, a missing
+    # optional list) and returns the remaining problems
+    if not isinstance(data, dict):
+        return {}, [f"Expected a JSON object, got {type(data).__name__}"]
+    errors = []
+    result = dict(data)
+    for field, spec in schema.items():
+        expected = spec["type"]
+        value = result.get(field)
+        if value is None:
+            if spec.get("required"):
+                errors.append(f"Missing required field '{field}'")
+            elif expected is list:
+                result[field] = []
+            continue
+        if isinstance(value, expected):
+            continue
+        if expected is list:
+            result[field] = [value]
+        elif expected is str and isinstance(value, (int, float, bool)):
+            result[field] = str(value)
+        else:
+            errors.append(f"Field '{field}' should be {expected.__name__}, got {type(value).__name__}")
+    return result, errors
+
+
+def parse_llm_json(text: str, schema: Optional[Dict[str, Dict]] = None) -> Dict:
+    # Raises ValueError when the output cannot be turned into a valid object
+    candidate = extract_json_text(text)
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(candidate))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+    if schema is None:
+        return data
+    data, errors = validate_schema(data, schema)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return data
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from config import PERFORMANCE_CONFIG, STORAGE_CONFIG
+
+class LLMResponseCache:
+    
+    def __init__(self, db_file: Optional[str] = None, ttl: Optional[int] = None, max_size_mb: Optional[float] = None):
+        if db_file is None:
+            # Lives alongside the summaries database
+            db_dir = os.path.dirname(STORAGE_CONFIG["database_file"])
+            db_file = os.path.join(db_dir, PERFORMANCE_CONFIG["cache_file"])
+        self.db_file = db_file
+        self.ttl = PERFORMANCE_CONFIG["cache_ttl"] if ttl is None else ttl
+        max_size_mb = PERFORMANCE_CONFIG["cache_max_size_mb"] if max_size_mb is None else max_size_mb
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        # Hits only record their access time here; it reaches the table in batches
+        self._pending_access: Dict[str, float] = {}
+        self.access_flush_every = PERFORMANCE_CONFIG["cache_access_flush_every"]
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._init_database()
+    
+    def _init_database(self):
+        
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_last_access ON llm_cache(last_access)')
+            self._conn.commit()
+    
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, temperature: float, max_tokens: int, json_mode: bool = False) -> str:
+        
+        # json_mode is only appended when set, so existing plain-text entries keep their keys
+        fields = [provider, model, prompt, temperature, max_tokens] + (["json"] if json_mode else [])
+        payload = json.dumps(fields, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT response, created_at FROM llm_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute('DELETE FROM llm_cache WHERE cache_key = ?', (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pending_access[key] = now
+            if len(self._pending_access) >= self.access_flush_every:
+                self._flush_access()
+                self._conn.commit()
+            return response
+    
+    def _flush_access(self):
+        # Caller holds the lock; LRU order only needs to be current when evicting
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            'UPDATE llm_cache SET last_access = ? WHERE cache_key = ?',
+            [(accessed, key) for key, accessed in self._pending_access.items()]
+        )
+        self._pending_access.clear()
+    
+    def set(self, key: str, response: str):
+        
+        now = time.time()
+        size_bytes = len(response.encode('utf-8'))
+        with self._lock:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO llm_cache (cache_key, response, size_bytes, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, response, size_bytes, now, now))
+            self._pending_access.pop(key, None)
+            self._flush_access()
+            self._evict(now)
+            self._conn.commit()
+    
+    def _evict(self, now: float):
+        # Expired entries first, then least recently used until under the size cap
+        if self.ttl:
+            self._conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - self.ttl,))
+        total = self._conn.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM llm_cache').fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        stale_keys = []
+        for cache_key, size_bytes in self._conn.execute(
+            'SELECT cache_key, size_bytes FROM llm_cache ORDER BY last_access ASC'
+        ).fetchall():
+            if total <= self.max_size_bytes:
+                break
+            stale_keys.append((cache_key,))
+            total -= size_bytes
+        self._conn.executemany('DELETE FROM llm_cache WHERE cache_key = ?', stale_keys)
+    
+    def clear(self):
+        
+        with self._lock:
+            self._conn.execute('DELETE FROM llm_cache')
+            self._conn.commit()
+            self._pending_access.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def close(self):
+        
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+            self._conn.close()
+    
+    def get_stats(self) -> Dict:
+        
+        with self._lock:
+            entries, size_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_cache'
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': size_bytes
+        }
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_response_cache() -> LLMResponseCache:
+    # One cache per process so counters survive Streamlit reruns
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMResponseCache()
+        return _shared_cache
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+import httpx
+import openai
+from config import PERFORMANCE_CONFIG
+
+# Try to import Gemini (google-generativeai)
+try:
+    import google.generativeai as genai
+    GEMINI_AVAILABLE = True
+except ImportError:
+    GEMINI_AVAILABLE = False
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[str, str, str], object] = {}
+_http_client: Optional[httpx.Client] = None
+# Fingerprint of the key genai is configured with; the key itself is never kept here
+_gemini_key_fingerprint: Optional[str] = None
+# Async connections are bound to the event loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _key_fingerprint(api_key: Optional[str]) -> str:
+    # Keys are only kept hashed in the registry index
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+def get_http_client() -> httpx.Client:
+    # One keep-alive pool shared by every OpenAI client in the process
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(
+                timeout=PERFORMANCE_CONFIG.get("request_timeout", 30),
+                limits=httpx.Limits(
+                    max_connections=PERFORMANCE_CONFIG.get("http_max_connections", 20),
+                    max_keepalive_connections=PERFORMANCE_CONFIG.get("http_max_keepalive_connections", 10),
+                    keepalive_expiry=PERFORMANCE_CONFIG.get("http_keepalive_expiry", 60)
+                )
+            )
+        return _http_client
+
+
+def get_openai_client(api_key: Optional[str], model: str = "") -> openai.OpenAI:
+
+    http_client = get_http_client()
+    key = ("openai", model, _key_fingerprint(api_key))
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # Retries are owned by llm_scheduler.RequestScheduler, not the SDK
+            client = openai.OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+            _clients[key] = client
+        return client
+
+
+def get_async_openai_client(api_key: Optional[str], model: str = "") -> openai.AsyncOpenAI:
+
+    loop = asyncio.get_running_loop()
+    key = ("openai", model, _key_fingerprint(api_key))
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            http_client = clients.get("http")
+            if http_client is None:
+                http_client = httpx.AsyncClient(
+                    timeout=PERFORMANCE_CONFIG.get("request_timeout", 30),
+                    limits=httpx.Limits(
+                        max_connections=PERFORMANCE_CONFIG.get("max_async_requests", 100),
+                        max_keepalive_connections=PERFORMANCE_CONFIG.get("http_max_keepalive_connections", 10),
+                        keepalive_expiry=PERFORMANCE_CONFIG.get("http_keepalive_expiry", 60)
+                    )
+                )
+                clients["http"] = http_client
+            client = openai.AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+            clients[key] = client
+        return client
+
+
+async def aclose_async_clients():
+    # Closes the connections opened on the running loop; later calls on it open new ones
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.pop(loop, None)
+    if clients and clients.get("http") is not None:
+        await clients["http"].aclose()
+
+
+def get_gemini_model(api_key: str, model: str = "gemini-2.5-flash"):
+
+    global _gemini_key_fingerprint
+    if not GEMINI_AVAILABLE:
+        raise ImportError("google-generativeai is not installed. Please install it to use Gemini.")
+    key = ("gemini", model, _key_fingerprint(api_key))
+    with _lock:
+        # genai.configure is process-global, so only reconfigure when the key changes
+        if _gemini_key_fingerprint != key[2]:
+            genai.configure(api_key=api_key)
+            _gemini_key_fingerprint = key[2]
+            for stale in [k for k in _clients if k[0] == "gemini" and k[2] != key[2]]:
+                del _clients[stale]
+        client = _clients.get(key)
+        if client is None:
+            client = genai.GenerativeModel(model)
+            _clients[key] = client
+        return client
+
+
+def clear_clients():
+
+    global _http_client, _gemini_key_fingerprint
+    with _lock:
+        _clients.clear()
+        async_pools = [(loop, clients.get("http")) for loop, clients in _async_clients.items()]
+        _async_clients.clear()
+        _gemini_key_fingerprint = None
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+    for loop, http_client in async_pools:
+        # An async pool can only be closed on its own loop; a closed loop took its sockets with it
+        if http_client is None or loop.is_closed():
+            continue
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(http_client.aclose(), loop)
+        else:
+            loop.run_until_complete(http_client.aclose())
@@ -0,0 +1,183 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from config import ERROR_CONFIG, PERFORMANCE_CONFIG
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Transient errors without an HTTP status (OpenAI transport errors, google.api_core exceptions)
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "TooManyRequests",
+    "TimeoutError", "ConnectionError"
+}
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep,
+                 async_sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _reserve(self, tokens: float) -> float:
+        # Takes the tokens and returns 0, or returns how long to wait before trying again
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if now >= self.paused_until and self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return max(self.paused_until - now, (tokens - self.tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1.0):
+        # Blocks until the bucket can pay for the request
+        wait = self._reserve(tokens)
+        while wait > 0:
+            self.sleep(wait)
+            wait = self._reserve(tokens)
+
+    async def aacquire(self, tokens: float = 1.0):
+        wait = self._reserve(tokens)
+        while wait > 0:
+            await self.async_sleep(wait)
+            wait = self._reserve(tokens)
+
+    def pause(self, seconds: float):
+        # A 429 pauses every caller on this provider, not just the one that saw it
+        with self._lock:
+            now = self.clock()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = now
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> TokenBucket:
+
+    with _buckets_lock:
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            limits = PERFORMANCE_CONFIG.get("rate_limits", {}).get(provider, {})
+            rate = limits.get("requests_per_minute", 60) / 60.0
+            bucket = TokenBucket(rate, limits.get("burst", 10))
+            _buckets[provider] = bucket
+        return bucket
+
+
+def _status_code(error: Exception) -> Optional[int]:
+
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None and isinstance(getattr(error, "code", None), int):
+        status = error.code
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RequestScheduler:
+
+    def __init__(self, provider: str, max_retries: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, timeout: Optional[float] = None,
+                 limiter: Optional[TokenBucket] = None, sleep: Callable[[float], None] = time.sleep,
+                 async_sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        self.provider = provider
+        self.max_retries = ERROR_CONFIG["max_retries"] if max_retries is None else max_retries
+        self.base_delay = ERROR_CONFIG["retry_delay"] if base_delay is None else base_delay
+        self.max_delay = ERROR_CONFIG.get("retry_max_delay", 30) if max_delay is None else max_delay
+        self.timeout = PERFORMANCE_CONFIG["request_timeout"] if timeout is None else timeout
+        self.limiter = limiter or get_rate_limiter(provider)
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = self.backoff(attempt, error)
+        if _status_code(error) == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+            self.limiter.pause(delay)
+        return delay
+
+    def call(self, fn: Callable[[], T]) -> T:
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            await self.limiter.aacquire()
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                await self.async_sleep(delay)
+                attempt += 1
@@ -1,93 +1,150 @@
+import asyncio
 import os
-from typing import Optional, List
-import openai
-
-# Try to import Gemini (google-generativeai)
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Iterable, Iterator, Optional, List, Tuple
+from config import CHUNK_CONFIG, OPENAI_CONFIG, PERFORMANCE_CONFIG
+from llm_cache import get_response_cache
+from llm_clients import GEMINI_AVAILABLE, aclose_async_clients, get_async_openai_client, get_gemini_model, get_openai_client
+from llm_scheduler import RequestScheduler
+from text_chunker import TokenChunker, content_boundary
 
 class LLMSummarizer:
-    def __init__(self, provider: str = "openai", model: str = "gpt-3.5-turbo", openai_api_key: Optional[str] = None):
+    def __init__(self, provider: str = "openai", model: str = "gpt-3.5-turbo", openai_api_key: Optional[str] = None, use_cache: Optional[bool] = None):
         self.provider = provider
         self.model = model
+        if use_cache is None:
+            use_cache = PERFORMANCE_CONFIG["enable_caching"]
+        self.cache = get_response_cache() if use_cache else None
+        # Content-defined sections keep their boundaries (and cached summaries) across local edits
+        self.chunker = TokenChunker(model=model, content_defined=True)
+        # Retries, backoff and per-provider rate limiting for every request
+        self.scheduler = RequestScheduler(provider)
         self.api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+        # Clients come from a process-wide registry so reruns reuse open connections
         if self.provider == "openai":
-            self.client = openai.OpenAI(api_key=self.api_key)
+            self.client = get_openai_client(self.api_key, model)
         elif self.provider == "gemini":
             if not GEMINI_AVAILABLE:
                 raise ImportError("google-generativeai is not installed. Please install it to use Gemini.")
             if not self.gemini_api_key:
                 raise ValueError("GEMINI_API_KEY not set in environment.")
-            genai.configure(api_key=self.gemini_api_key)
-            self.gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+            self.gemini_model = get_gemini_model(self.gemini_api_key)
         else:
             raise ValueError(f"Unknown provider: {self.provider}")
 
     def set_api_key(self, api_key: str):
         if self.provider == "openai":
             self.api_key = api_key
-            self.client = openai.OpenAI(api_key=api_key)
+            self.client = get_openai_client(api_key, self.model)
         elif self.provider == "gemini":
             self.gemini_api_key = api_key
-            genai.configure(api_key=api_key)
-            self.gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+            self.gemini_model = get_gemini_model(api_key)
 
     def summarize(self, text: str, model: Optional[str] = None, length: str = "Medium (200-400 words)") -> Optional[str]:
         if not text or len(text.strip()) == 0:
             raise Exception("No text provided for summarization.")
-        word_limits = {
-            "Short (100-200 words)": (100, 200),
-            "Medium (200-400 words)": (200, 400),
-            "Long (400-600 words)": (400, 600)
-        }
-        min_words, max_words = word_limits.get(length, (200, 400))
-        prompt = self._create_summary_prompt(text, min_words, max_words)
+        min_words, max_words = self._word_range(length)
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=model or self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=1024,
-                    temperature=0.5
-                )
-                summary = response.choices[0].message.content.strip()
-            elif self.provider == "gemini":
-                response = self.gemini_model.generate_content(prompt)
-                summary = response.text.strip() if response.text else ""
+            chunks = self._sections(text)
+            if len(chunks) > 1:
+                summary = self._map_reduce_summarize(chunks, min_words, max_words, model)
             else:
-                raise ValueError(f"Unknown provider: {self.provider}")
+                prompt = self._create_summary_prompt(chunks[0], min_words, max_words)
+                summary = self._complete(prompt, model=model, max_tokens=1024, temperature=0.5)
             if not summary:
                 raise Exception("No summary returned ")
             return summary
         except Exception as e:
             raise Exception(f"{self.provider.capitalize()} error: {str(e)}")
 
+    def _word_range(self, length: str) -> Tuple[int, int]:
+        word_limits = {
+            "Short (100-200 words)": (100, 200),
+            "Medium (200-400 words)": (200, 400),
+            "Long (400-600 words)": (400, 600)
+        }
+        return word_limits.get(length, (200, 400))
+
+    def _sections(self, text: str) -> List[str]:
+        # Text that fits one chunk is summarised in a single call, since content-defined
+        # boundaries may otherwise split it
+        if self.chunker.fits(text):
+            return [text.strip()]
+        return list(self.chunker.iter_chunks(text))
+
+    def _reduce_fan_in(self) -> int:
+        return max(2, min(CHUNK_CONFIG["reduce_fan_in"], self.chunker.max_tokens // CHUNK_CONFIG["section_summary_tokens"]))
+
+    def _reduce_groups(self, summaries: List[str], fan_in: int) -> List[str]:
+        # A group closes after a summary whose hash hits the divisor once it holds half the
+        # fan-in, or when full. Like content-defined chunking, an edited section then only
+        # regroups its neighbours instead of shifting every later group.
+        min_size = max(2, fan_in // 2)
+        groups = []
+        group: List[str] = []
+        for summary in summaries:
+            group.append(summary)
+            if len(group) >= fan_in or (len(group) >= min_size and content_boundary(summary, fan_in // 4)):
+                groups.append("\n\n".join(group))
+                group = []
+        if group:
+            groups.append("\n\n".join(group))
+        return groups
+
+    def _map_reduce_summarize(self, chunks: List[str], min_words: int, max_words: int, model: Optional[str] = None) -> str:
+        # Sections are summarised concurrently, then combined in content-defined groups
+        # tier by tier. Every call goes through the response cache, and both section and
+        # group boundaries depend only on nearby content, so after a local edit only the
+        # changed branch is recomputed.
+        section_tokens = CHUNK_CONFIG["section_summary_tokens"]
+        fan_in = self._reduce_fan_in()
+        summaries = self._run_concurrently(
+            lambda chunk: self._complete(self._create_section_prompt(chunk), model=model, max_tokens=section_tokens, temperature=0.5),
+            chunks
+        )
+        while len(summaries) > fan_in:
+            groups = self._reduce_groups(summaries, fan_in)
+            summaries = self._run_concurrently(
+                lambda group: self._complete(self._create_section_prompt(group, combine=True), model=model, max_tokens=section_tokens, temperature=0.5),
+                groups
+            )
+        combined = "\n\n".join(summaries)
+        prompt = self._create_summary_prompt(combined, min_words, max_words)
+        return self._complete(prompt, model=model, max_tokens=1024, temperature=0.5)
+
+    def _run_concurrently(self, fn: Callable, items: List) -> List:
+        
+        max_workers = max(1, min(PERFORMANCE_CONFIG["max_concurrent_requests"], len(items)))
+        if max_workers == 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(fn, items))
+
+    def _create_section_prompt(self, text: str, combine: bool = False) -> str:
+        if combine:
+            instruction = (
+                "The following are summaries of consecutive sections of a longer document. "
+                "Merge them into a single coherent summary that keeps every key point, figure and obligation."
+            )
+        else:
+            instruction = (
+                "The following is one section of a longer document. "
+                "Summarize it concisely, keeping key points, figures, names and obligations."
+            )
+        return f"{instruction}\n\nText:\n{text}\n\nSummary:"
+
     def key_takeaways(self, text: str) -> List[str]:
         if not text or len(text.strip()) == 0:
             raise Exception("No text provided for key takeaways.")
+        text = self.chunker.truncate(text)
         prompt = (
             "List the 5 most important, precise, and meaningful key takeaways from the following text. "
             "Each takeaway should be a single line. Do not exceed 5 lines. Be clear and specific.\n\n"
-            f"Text to analyze:\n{text[:8000]}\n\nKey takeaways (one per line):"
+            f"Text to analyze:\n{text}\n\nKey takeaways (one per line):"
         )
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=512,
-                    temperature=0.5
-                )
-                takeaways_text = response.choices[0].message.content.strip()
-            elif self.provider == "gemini":
-                response = self.gemini_model.generate_content(prompt)
-                takeaways_text = response.text.strip() if response.text else ""
-            else:
-                raise ValueError(f"Unknown provider: {self.provider}")
+            takeaways_text = self._complete(prompt, max_tokens=512, temperature=0.5)
             lines = [line.lstrip('-•0123456789. ').strip() for line in takeaways_text.splitlines() if line.strip()]
             return lines[:5]
         except Exception as e:
@@ -104,7 +161,7 @@ Please provide a comprehensive summary of the following text. The summary should
 6. Use clear, professional language
 
 Text to summarize:
-{text[:8000]}
+{text}
 
 Please provide the summary:
 """
@@ -144,20 +201,202 @@ Please provide the summary:
             "estimated_cost_usd": 0.0
         }
 
-    def generate(self, prompt: str) -> str:
+    def supports_json_mode(self, model: Optional[str] = None) -> bool:
+        if self.provider == "gemini":
+            return True
+        return (model or self.model) in OPENAI_CONFIG["json_mode_models"]
+
+    def _json_mode_options(self, model: Optional[str] = None) -> dict:
+        # Provider-native structured output, so the response is a bare JSON object
+        if not self.supports_json_mode(model):
+            return {}
+        if self.provider == "gemini":
+            return {"generation_config": {"response_mime_type": "application/json"}}
+        return {"response_format": {"type": "json_object"}}
+
+    def generate(self, prompt: str, json_mode: bool = False) -> str:
+        try:
+            return self._complete(prompt, max_tokens=1024, temperature=0.5, json_mode=json_mode)
+        except Exception as e:
+            raise Exception(f"{self.provider.capitalize()} error (generate): {str(e)}") 
+
+    def generate_stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.5, json_mode: bool = False) -> Iterator[str]:
+        # Yields text deltas as they arrive; the full completion is cached at the end
+        options = self._json_mode_options() if json_mode else {}
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.provider, self.model, prompt, temperature, max_tokens, bool(options))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
         try:
             if self.provider == "openai":
-                response = self.client.chat.completions.create(
+                # Only opening the stream is retried; a half-delivered stream is not replayed
+                stream = self.scheduler.call(lambda: self.client.chat.completions.create(
                     model=self.model,
                     messages=[{"role": "user", "content": prompt}],
-                    max_tokens=1024,
-                    temperature=0.5
-                )
-                return response.choices[0].message.content.strip()
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                    timeout=self.scheduler.timeout,
+                    **options
+                ))
+                for event in stream:
+                    delta = event.choices[0].delta.content if event.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield delta
             elif self.provider == "gemini":
-                response = self.gemini_model.generate_content(prompt)
-                return response.text.strip() if response.text else ""
+                response = self.scheduler.call(lambda: self.gemini_model.generate_content(
+                    prompt, stream=True, request_options={"timeout": self.scheduler.timeout}, **options
+                ))
+                for chunk in response:
+                    delta = chunk.text if chunk.parts else ""
+                    if delta:
+                        parts.append(delta)
+                        yield delta
             else:
                 raise ValueError(f"Unknown provider: {self.provider}")
         except Exception as e:
-            raise Exception(f"{self.provider.capitalize()} error (generate): {str(e)}") 
\ No newline at end of file
+            raise Exception(f"{self.provider.capitalize()} error (generate): {str(e)}")
+        content = "".join(parts).strip()
+        if cache_key is not None and content:
+            self.cache.set(cache_key, content)
+
+    def _complete(self, prompt: str, model: Optional[str] = None, max_tokens: int = 1024, temperature: float = 0.5, json_mode: bool = False) -> str:
+        model = model or self.model
+        options = self._json_mode_options(model) if json_mode else {}
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.provider, model, prompt, temperature, max_tokens, bool(options))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        if self.provider == "openai":
+            response = self.scheduler.call(lambda: self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=self.scheduler.timeout,
+                **options
+            ))
+            content = response.choices[0].message.content.strip()
+        elif self.provider == "gemini":
+            response = self.scheduler.call(lambda: self.gemini_model.generate_content(
+                prompt, request_options={"timeout": self.scheduler.timeout}, **options
+            ))
+            content = response.text.strip() if response.text else ""
+        else:
+            raise ValueError(f"Unknown provider: {self.provider}")
+        # Empty completions are treated as failures by callers, so never cache them
+        if cache_key is not None and content:
+            self.cache.set(cache_key, content)
+        return content
+
+    def get_cache_stats(self) -> dict:
+        if self.cache is None:
+            return {}
+        return self.cache.get_stats()
+
+
+async def gather_bounded(fn: Callable[..., Awaitable], items: Iterable, limit: Optional[int] = None) -> List:
+    # asyncio counterpart of _run_concurrently: at most `limit` coroutines in flight, results in input order
+    semaphore = asyncio.Semaphore(limit or PERFORMANCE_CONFIG["max_async_requests"])
+
+    async def run(item):
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+class AsyncLLMSummarizer(LLMSummarizer):
+    # Same prompts, cache and rate limits as LLMSummarizer, but every provider call is a
+    # coroutine, so hundreds of requests can be in flight from a single thread
+
+    async def _acomplete(self, prompt: str, model: Optional[str] = None, max_tokens: int = 1024, temperature: float = 0.5, json_mode: bool = False) -> str:
+        model = model or self.model
+        options = self._json_mode_options(model) if json_mode else {}
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.provider, model, prompt, temperature, max_tokens, bool(options))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        if self.provider == "openai":
+            client = get_async_openai_client(self.api_key, self.model)
+            response = await self.scheduler.acall(lambda: client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=self.scheduler.timeout,
+                **options
+            ))
+            content = response.choices[0].message.content.strip()
+        elif self.provider == "gemini":
+            response = await self.scheduler.acall(lambda: self.gemini_model.generate_content_async(
+                prompt, request_options={"timeout": self.scheduler.timeout}, **options
+            ))
+            content = response.text.strip() if response.text else ""
+        else:
+            raise ValueError(f"Unknown provider: {self.provider}")
+        if cache_key is not None and content:
+            self.cache.set(cache_key, content)
+        return content
+
+    async def aclose(self):
+        # Releases the pooled connections this event loop opened for async requests
+        await aclose_async_clients()
+
+    async def __aenter__(self) -> "AsyncLLMSummarizer":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def agenerate(self, prompt: str, json_mode: bool = False) -> str:
+        try:
+            return await self._acomplete(prompt, max_tokens=1024, temperature=0.5, json_mode=json_mode)
+        except Exception as e:
+            raise Exception(f"{self.provider.capitalize()} error (generate): {str(e)}")
+
+    async def agenerate_many(self, prompts: Iterable[str], limit: Optional[int] = None) -> List[str]:
+        return await gather_bounded(self.agenerate, prompts, limit)
+
+    async def asummarize(self, text: str, model: Optional[str] = None, length: str = "Medium (200-400 words)") -> Optional[str]:
+        if not text or len(text.strip()) == 0:
+            raise Exception("No text provided for summarization.")
+        min_words, max_words = self._word_range(length)
+        try:
+            chunks = self._sections(text)
+            if len(chunks) > 1:
+                summary = await self._amap_reduce_summarize(chunks, min_words, max_words, model)
+            else:
+                prompt = self._create_summary_prompt(chunks[0], min_words, max_words)
+                summary = await self._acomplete(prompt, model=model, max_tokens=1024, temperature=0.5)
+            if not summary:
+                raise Exception("No summary returned ")
+            return summary
+        except Exception as e:
+            raise Exception(f"{self.provider.capitalize()} error: {str(e)}")
+
+    async def _amap_reduce_summarize(self, chunks: List[str], min_words: int, max_words: int, model: Optional[str] = None) -> str:
+        section_tokens = CHUNK_CONFIG["section_summary_tokens"]
+        fan_in = self._reduce_fan_in()
+        summaries = await gather_bounded(
+            lambda chunk: self._acomplete(self._create_section_prompt(chunk), model=model, max_tokens=section_tokens, temperature=0.5),
+            chunks
+        )
+        while len(summaries) > fan_in:
+            groups = self._reduce_groups(summaries, fan_in)
+            summaries = await gather_bounded(
+                lambda group: self._acomplete(self._create_section_prompt(group, combine=True), model=model, max_tokens=section_tokens, temperature=0.5),
+                groups
+            )
+        combined = "\n\n".join(summaries)
+        prompt = self._create_summary_prompt(combined, min_words, max_words)
+        return await self._acomplete(prompt, model=model, max_tokens=1024, temperature=0.5)
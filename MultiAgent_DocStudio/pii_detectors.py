@@ -0,0 +1,131 @@
+import re
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from rule_engine import DEFAULT_RULES, luhn_valid
+
+# Chunks are joined with a separator no detector pattern can match across
+SEPARATOR = "\x00"
+
+FINDING_COLUMNS = ["chunk_index", "rule", "category", "kind", "start", "end", "match"]
+
+
+def _rule_pattern(name: str) -> str:
+    # Shared identifiers reuse the rule engine's patterns so both report the same spans
+    return next(rule["patterns"][0] for rule in DEFAULT_RULES if rule["name"] == name)
+
+
+def iban_valid(value: str) -> bool:
+
+    iban = value.replace(" ", "").upper()
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    digits = "".join(str(int(c, 36)) for c in rearranged)
+    return int(digits) % 97 == 1
+
+
+DETECTORS = [
+    {
+        "name": "Email address",
+        "pattern": _rule_pattern("Email address"),
+        "category": "PII",
+        "domains": ["GDPR", "HIPAA"]
+    },
+    {
+        "name": "US Social Security number",
+        "pattern": _rule_pattern("US Social Security number"),
+        "category": "PII",
+        "domains": ["GDPR", "HIPAA", "PCI-DSS"]
+    },
+    {
+        "name": "Date of birth",
+        "pattern": r"\b(?:DOB|D\.O\.B\.|date of birth|born(?: on)?)[\s:]*(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}-\d{2}-\d{2})",
+        "category": "PII",
+        "domains": ["GDPR", "HIPAA"]
+    },
+    {
+        "name": "Payment card number",
+        "pattern": _rule_pattern("Payment card number"),
+        "validator": luhn_valid,
+        "category": "PCI",
+        "domains": ["PCI-DSS", "GDPR"]
+    },
+    {
+        "name": "IBAN",
+        "pattern": r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b",
+        "validator": iban_valid,
+        "flags": 0,
+        "category": "PII",
+        "domains": ["GDPR", "PCI-DSS"]
+    },
+    {
+        "name": "Medical record number",
+        "pattern": _rule_pattern("Medical record number"),
+        "category": "PHI",
+        "domains": ["HIPAA"]
+    },
+    {
+        "name": "Phone number",
+        "pattern": r"(?<![\d-])(?:\+\d{1,3}[ .-]?)?\(?\d{3}\)?[ .-]?\d{3}[ .-]\d{4}(?![\d-])",
+        "category": "PII",
+        "domains": ["GDPR", "HIPAA"]
+    }
+]
+
+
+class PIIDetector:
+    # Scans a whole batch of chunks per detector: the chunks are joined into one string,
+    # each pattern runs over it once, and match offsets are mapped back to chunks with
+    # a vectorised searchsorted
+
+    def __init__(self, domain: Optional[str] = None, detectors: Optional[List[Dict]] = None):
+        detectors = DETECTORS if detectors is None else detectors
+        self.detectors = [d for d in detectors if not domain or domain in d.get("domains", [domain])]
+        self._compiled = [re.compile(d["pattern"], d.get("flags", re.IGNORECASE)) for d in self.detectors]
+
+    def scan(self, chunks: Sequence[str]) -> pd.DataFrame:
+
+        if len(chunks) == 0 or not self.detectors:
+            return pd.DataFrame(columns=FINDING_COLUMNS)
+        series = pd.Series(chunks, dtype=object).fillna("")
+        lengths = series.str.len().to_numpy()
+        starts = np.concatenate(([0], np.cumsum(lengths + len(SEPARATOR))[:-1]))
+        joined = SEPARATOR.join(series.tolist())
+
+        frames = []
+        for detector, regex in zip(self.detectors, self._compiled):
+            matches = [(m.start(), m.end(), m.group()) for m in regex.finditer(joined)]
+            if not matches:
+                continue
+            frame = pd.DataFrame(matches, columns=["start", "end", "match"])
+            validator = detector.get("validator")
+            if validator is not None:
+                frame = frame[frame["match"].map(validator)]
+                if frame.empty:
+                    continue
+            chunk_index = np.searchsorted(starts, frame["start"].to_numpy(), side="right") - 1
+            frame = frame.assign(
+                chunk_index=chunk_index,
+                start=frame["start"].to_numpy() - starts[chunk_index],
+                end=frame["end"].to_numpy() - starts[chunk_index],
+                rule=detector["name"],
+                category=detector["category"],
+                kind="violation"
+            )
+            frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame(columns=FINDING_COLUMNS)
+        findings = pd.concat(frames, ignore_index=True)[FINDING_COLUMNS]
+        return findings.sort_values(["chunk_index", "start", "end"], kind="stable").reset_index(drop=True)
+
+    def findings_by_chunk(self, chunks: Sequence[str]) -> List[List[Dict]]:
+        # Same finding dicts as RuleEngine.scan, with offsets relative to each chunk
+        grouped: List[List[Dict]] = [[] for _ in range(len(chunks))]
+        for record in self.scan(chunks).to_dict("records"):
+            chunk_index = int(record.pop("chunk_index"))
+            record["start"] = int(record["start"])
+            record["end"] = int(record["end"])
+            grouped[chunk_index].append(record)
+        return grouped
@@ -0,0 +1,220 @@
+import re
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# A rule is a dict:
+#   name      - shown in reports
+#   type      - "keyword" (matched together through one Aho-Corasick automaton) or "regex"
+#   patterns  - keywords or regular expressions; a rule without any (e.g. a bare
+#               {"name": ...} checklist entry) is reported as checked but never matches
+#   case_sensitive - regex rules match case-insensitively unless this is true
+#   category  - PII / PHI / PCI / CONTEXT
+#   kind      - "violation" findings are merged into violations; "context" findings only
+#               mark a chunk as ambiguous so it is escalated to the LLM
+#   validator - optional name from VALIDATORS that a regex match must also pass
+#   domains   - compliance domains the rule applies to (all when missing)
+DEFAULT_RULES = [
+    {
+        "name": "Email address",
+        "type": "regex",
+        "patterns": [r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b"],
+        "category": "PII",
+        "kind": "violation",
+        "domains": ["GDPR", "HIPAA"]
+    },
+    {
+        "name": "US Social Security number",
+        "type": "regex",
+        "patterns": [r"\b(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}\b"],
+        "category": "PII",
+        "kind": "violation",
+        "domains": ["GDPR", "HIPAA", "PCI-DSS"]
+    },
+    {
+        "name": "Payment card number",
+        "type": "regex",
+        "patterns": [r"\b\d(?:[ -]?\d){12,18}\b"],
+        "validator": "luhn",
+        "category": "PCI",
+        "kind": "violation",
+        "domains": ["PCI-DSS", "GDPR"]
+    },
+    {
+        "name": "Medical record number",
+        "type": "regex",
+        "patterns": [r"\b(?:MRN|Medical Record (?:No\.?|Number))[\s:#]*\d{6,10}\b"],
+        "category": "PHI",
+        "kind": "violation",
+        "domains": ["HIPAA"]
+    },
+    {
+        "name": "Health information",
+        "type": "keyword",
+        "patterns": ["diagnosis", "diagnosed", "prescription", "medical record", "patient", "treatment", "lab results"],
+        "category": "PHI",
+        "kind": "context",
+        "domains": ["HIPAA"]
+    },
+    {
+        "name": "Cardholder data",
+        "type": "keyword",
+        "patterns": ["cardholder", "cvv", "cvc", "card number", "expiry date", "primary account number"],
+        "category": "PCI",
+        "kind": "context",
+        "domains": ["PCI-DSS"]
+    },
+    {
+        "name": "Personal data processing",
+        "type": "keyword",
+        "patterns": ["personal data", "data subject", "consent", "third party", "third parties",
+                     "retention", "transfer", "profiling", "date of birth"],
+        "category": "CONTEXT",
+        "kind": "context",
+        "domains": ["GDPR"]
+    }
+]
+
+
+def luhn_valid(value: str) -> bool:
+
+    digits = [int(c) for c in value if c.isdigit()]
+    if len(digits) < 13:
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+VALIDATORS: Dict[str, Callable[[str], bool]] = {
+    "luhn": luhn_valid
+}
+
+
+class AhoCorasick:
+    # Multi-pattern keyword matcher: one pass over the text whatever the number of keywords
+
+    def __init__(self, keywords: Iterable[Tuple[str, int]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, int]]] = [[]]
+        for keyword, rule_index in keywords:
+            self._add(keyword, rule_index)
+        self._build()
+
+    def _add(self, keyword: str, rule_index: int):
+        node = 0
+        for char in keyword:
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append((len(keyword), rule_index))
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self.goto[node].items():
+                queue.append(nxt)
+                if node == 0:
+                    self.fail[nxt] = 0
+                else:
+                    fallback = self.fail[node]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterable[Tuple[int, int, int]]:
+        # Yields (start, end, rule_index)
+        node = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, rule_index in output[node]:
+                yield position + 1 - length, position + 1, rule_index
+
+
+def _lower_preserving_offsets(text: str) -> str:
+
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # A few characters (e.g. 'İ') grow when lowercased; leave those as they are
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+class RuleEngine:
+
+    def __init__(self, rules: Optional[List[Dict]] = None, domain: Optional[str] = None):
+        rules = DEFAULT_RULES if rules is None else rules
+        self.rules = [rule for rule in rules if not domain or domain in rule.get("domains", [domain])]
+        keywords = []
+        # Each regex is compiled on its own so its flags, groups and backreferences mean what
+        # the rule author wrote, and matches of different rules may overlap
+        self._regexes: List[Tuple[re.Pattern, int]] = []
+        for rule_index, rule in enumerate(self.rules):
+            patterns = rule.get("patterns") or ([rule["pattern"]] if rule.get("pattern") else [])
+            if rule.get("validator") and rule["validator"] not in VALIDATORS:
+                raise ValueError(f"Rule '{rule.get('name')}' uses unknown validator '{rule['validator']}'")
+            if rule.get("type", "keyword") == "keyword":
+                keywords.extend((pattern.lower(), rule_index) for pattern in patterns)
+                continue
+            flags = 0 if rule.get("case_sensitive") else re.IGNORECASE
+            for pattern in patterns:
+                try:
+                    self._regexes.append((re.compile(pattern, flags), rule_index))
+                except re.error as e:
+                    raise ValueError(f"Rule '{rule.get('name')}' has an invalid pattern {pattern!r}: {e}")
+        # Keywords of every rule share one automaton, so they cost a single pass
+        self._automaton = AhoCorasick(keywords) if keywords else None
+        self.has_matchers = bool(keywords or self._regexes)
+
+    def scan(self, text: str) -> List[Dict]:
+
+        findings = []
+        if self._automaton is not None:
+            lowered = _lower_preserving_offsets(text)
+            for start, end, rule_index in self._automaton.iter_matches(lowered):
+                # Whole words only, so "patient" does not fire inside "outpatients"
+                if (start > 0 and lowered[start - 1].isalnum()) or (end < len(lowered) and lowered[end].isalnum()):
+                    continue
+                findings.append(self._finding(rule_index, text, start, end))
+        for regex, rule_index in self._regexes:
+            validator = VALIDATORS.get(self.rules[rule_index].get("validator"))
+            for match in regex.finditer(text):
+                if validator and not validator(match.group()):
+                    continue
+                findings.append(self._finding(rule_index, text, match.start(), match.end()))
+        findings.sort(key=lambda finding: (finding["start"], finding["end"]))
+        return findings
+
+    def _finding(self, rule_index: int, text: str, start: int, end: int) -> Dict:
+
+        rule = self.rules[rule_index]
+        return {
+            "rule": rule["name"],
+            "category": rule.get("category", ""),
+            "kind": rule.get("kind", "violation"),
+            "start": start,
+            "end": end,
+            "match": text[start:end]
+        }
+
+    def assign_to_spans(self, findings: List[Dict], spans: List[Tuple[int, int]]) -> List[List[Dict]]:
+        # A finding belongs to every span its start falls in; findings are sorted by
+        # start, so each span's share is a bisected slice
+        starts = [finding["start"] for finding in findings]
+        return [findings[bisect_left(starts, start):bisect_left(starts, end)] for start, end in spans]
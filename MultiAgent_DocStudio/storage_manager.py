@@ -1,74 +1,418 @@
 import json
 import csv
+import gzip
+import queue
+import re
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from config import STORAGE_CONFIG
+
+# Parquet export is optional and needs pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Advisory file locks for the JSON Lines store: fcntl on POSIX, msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+SUMMARY_COLUMNS = (
+    'filename', 'file_type', 'file_size_kb', 'original_word_count',
+    'summary', 'summary_word_count', 'model_used', 'summary_length',
+    'date', 'extracted_text'
+)
+
+# Default projection for list views; extracted_text is only loaded when asked for
+LIST_COLUMNS = tuple(column for column in SUMMARY_COLUMNS if column != 'extracted_text')
+
+# Statements are kept as constants so sqlite3's per-connection statement cache reuses them
+INSERT_SUMMARY_SQL = '''
+    INSERT INTO summaries (
+        filename, file_type, file_size_kb, original_word_count,
+        summary, summary_word_count, model_used, summary_length,
+        date, extracted_text
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SELECT_SUMMARIES_SQL = '''
+    SELECT filename, file_type, file_size_kb, original_word_count,
+           summary, summary_word_count, model_used, summary_length,
+           date, extracted_text
+    FROM summaries
+    ORDER BY created_at DESC
+'''
+
+STATISTICS_SQL = '''
+    SELECT COUNT(*),
+           COALESCE(SUM(original_word_count), 0),
+           COALESCE(AVG(summary_word_count), 0),
+           COALESCE(SUM(date(created_at) = date('now')), 0),
+           (SELECT json_group_array(json_array(model_used, n))
+            FROM (SELECT model_used, COUNT(*) AS n FROM summaries GROUP BY model_used)),
+           (SELECT json_group_array(json_array(file_type, n))
+            FROM (SELECT file_type, COUNT(*) AS n FROM summaries GROUP BY file_type))
+    FROM summaries
+'''
+
+# External-content FTS5 index over the searchable columns, kept in sync by triggers
+FTS_SCHEMA_SQL = (
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS summaries_fts USING fts5(
+        filename, summary, extracted_text,
+        content='summaries', content_rowid='id', tokenize='unicode61'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS summaries_fts_insert AFTER INSERT ON summaries BEGIN
+        INSERT INTO summaries_fts(rowid, filename, summary, extracted_text)
+        VALUES (new.id, new.filename, new.summary, new.extracted_text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS summaries_fts_delete AFTER DELETE ON summaries BEGIN
+        INSERT INTO summaries_fts(summaries_fts, rowid, filename, summary, extracted_text)
+        VALUES ('delete', old.id, old.filename, old.summary, old.extracted_text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS summaries_fts_update AFTER UPDATE ON summaries BEGIN
+        INSERT INTO summaries_fts(summaries_fts, rowid, filename, summary, extracted_text)
+        VALUES ('delete', old.id, old.filename, old.summary, old.extracted_text);
+        INSERT INTO summaries_fts(rowid, filename, summary, extracted_text)
+        VALUES (new.id, new.filename, new.summary, new.extracted_text);
+    END
+    '''
+)
+
+# Filename matches weigh most, then the summary, then the raw extracted text
+FTS_SEARCH_SQL = '''
+    SELECT s.filename, s.file_type, s.file_size_kb, s.original_word_count,
+           s.summary, s.summary_word_count, s.model_used, s.summary_length,
+           s.date, s.extracted_text,
+           snippet(summaries_fts, -1, '**', '**', '...', 16)
+    FROM summaries_fts
+    JOIN summaries s ON s.id = summaries_fts.rowid
+    WHERE summaries_fts MATCH ?
+    ORDER BY bm25(summaries_fts, 10.0, 5.0, 1.0)
+    LIMIT ? OFFSET ?
+'''
+
+class SQLiteConnectionPool:
+    
+    def __init__(self, db_file: str, max_size: Optional[int] = None):
+        self.db_file = db_file
+        self.max_size = max_size or STORAGE_CONFIG["sqlite_pool_size"]
+        self._idle = queue.LifoQueue(maxsize=self.max_size)
+        self._closed = False
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are handed to one thread at a time, so sharing across threads is safe
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=STORAGE_CONFIG["sqlite_busy_timeout_ms"] / 1000,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA cache_size=-{int(STORAGE_CONFIG["sqlite_cache_size_kb"])}')
+        conn.execute(f'PRAGMA busy_timeout={int(STORAGE_CONFIG["sqlite_busy_timeout_ms"])}')
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # A connection checked out while the pool was closed is not kept around
+            with self._lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    try:
+                        self._idle.put_nowait(conn)
+                    except queue.Full:
+                        conn.close()
+    
+    def close_all(self):
+        
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools: Dict[str, SQLiteConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+# Serialises JSON Lines appends and the one-time migration within the process;
+# _jsonl_file_lock extends that to other processes sharing the same file
+_jsonl_lock = threading.Lock()
+
+@contextmanager
+def _jsonl_file_lock(jsonl_file: str):
+    
+    with _jsonl_lock:
+        fd = os.open(f"{jsonl_file}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+def get_connection_pool(db_file: str) -> SQLiteConnectionPool:
+    # One pool per database file, shared by every StorageManager in the process
+    key = os.path.abspath(db_file)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SQLiteConnectionPool(db_file)
+        return _pools[key]
+
+class SummaryWriteQueue:
+    # Buffers summaries and writes them with StorageManager.save_many from a background
+    # thread once max_batch rows are queued or flush_interval seconds have passed.
+    
+    def __init__(self, storage: 'StorageManager', max_batch: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.storage = storage
+        self.max_batch = max_batch or STORAGE_CONFIG["write_batch_size"]
+        self.flush_interval = flush_interval or STORAGE_CONFIG["write_flush_interval"]
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._error: Optional[Exception] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="summary-write-behind", daemon=True)
+        self._thread.start()
+    
+    def submit(self, summary_data: Dict):
+        
+        with self._lock:
+            if self._closed:
+                raise Exception("Write queue is closed")
+            self._pending.append(summary_data)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+    
+    def _run(self):
+        
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._in_flight = len(batch)
+                closed = self._closed
+            if batch:
+                try:
+                    self.storage.save_many(batch)
+                except Exception as e:
+                    self._error = e
+            with self._lock:
+                self._in_flight = 0
+                self._flushed.notify_all()
+                if closed:
+                    if not self._pending:
+                        return
+                    self._wake.set()
+    
+    def flush(self, timeout: Optional[float] = None):
+        
+        self._wake.set()
+        with self._lock:
+            self._flushed.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise Exception(f"Error in background summary write: {str(error)}")
+    
+    def close(self):
+        
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise Exception(f"Error in background summary write: {str(error)}")
 
 class StorageManager:
   
     
     def __init__(self):
         self.json_file = "summaries.json"
+        self.jsonl_file = "summaries.jsonl"
         self.csv_file = "summaries.csv"
         self.db_file = "summaries.db"
+        self.fts_enabled = False
         self._init_database()
     
+    def _connection(self):
+        
+        return get_connection_pool(self.db_file).connection()
+    
+    def close(self):
+        
+        key = os.path.abspath(self.db_file)
+        with _pools_lock:
+            pool = _pools.pop(key, None)
+        if pool is not None:
+            pool.close_all()
+    
+    def _row_to_dict(self, row) -> Dict:
+        
+        return dict(zip(SUMMARY_COLUMNS, row))
+    
     def _init_database(self):
         
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-          
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS summaries (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    filename TEXT NOT NULL,
-                    file_type TEXT,
-                    file_size_kb REAL,
-                    original_word_count INTEGER,
-                    summary TEXT NOT NULL,
-                    summary_word_count INTEGER,
-                    model_used TEXT,
-                    summary_length TEXT,
-                    date TEXT NOT NULL,
-                    extracted_text TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-         
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_filename ON summaries(filename)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_date ON summaries(date)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_model ON summaries(model_used)')
+            with self._connection() as conn, conn:
+                cursor = conn.cursor()
+                
+              
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS summaries (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        filename TEXT NOT NULL,
+                        file_type TEXT,
+                        file_size_kb REAL,
+                        original_word_count INTEGER,
+                        summary TEXT NOT NULL,
+                        summary_word_count INTEGER,
+                        model_used TEXT,
+                        summary_length TEXT,
+                        date TEXT NOT NULL,
+                        extracted_text TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+             
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_filename ON summaries(filename)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_date ON summaries(date)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_model ON summaries(model_used)')
             
-            conn.commit()
-            conn.close()
+            self._init_fts()
             
         except Exception as e:
             print(f"Error initializing database: {str(e)}")
     
+    def _init_fts(self):
+        
+        try:
+            with self._connection() as conn, conn:
+                existed = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'summaries_fts'"
+                ).fetchone()
+                for statement in FTS_SCHEMA_SQL:
+                    conn.execute(statement)
+                if not existed:
+                    # Index rows written before the FTS table existed
+                    conn.execute("INSERT INTO summaries_fts(summaries_fts) VALUES ('rebuild')")
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 keep using LIKE search
+            print(f"Full-text search unavailable, falling back to LIKE: {str(e)}")
+            self.fts_enabled = False
+    
     def save_to_json(self, summary_data: Dict):
         
         try:
-            summaries = []
-            
-            
-            if os.path.exists(self.json_file):
-                with open(self.json_file, 'r', encoding='utf-8') as f:
-                    summaries = json.load(f)
+            self._migrate_json_array()
+            line = (json.dumps(summary_data, ensure_ascii=False, default=str) + "\n").encode('utf-8')
             
-           
-            summaries.append(summary_data)
-            
-            
-            with open(self.json_file, 'w', encoding='utf-8') as f:
-                json.dump(summaries, f, indent=2, ensure_ascii=False)
+            # O(1) append: the whole record goes out in one O_APPEND write, so readers
+            # only ever see complete lines (plus, at worst, a torn tail after a crash)
+            with _jsonl_file_lock(self.jsonl_file):
+                fd = os.open(self.jsonl_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    written = 0
+                    while written < len(line):
+                        written += os.write(fd, line[written:])
+                finally:
+                    os.close(fd)
                 
         except Exception as e:
             raise Exception(f"Error saving to JSON: {str(e)}")
     
+    def _migrate_json_array(self):
+        # One-time conversion of the legacy summaries.json array into JSON Lines. Retiring the
+        # legacy file is the commit point: the merged file is fully written before it, so a
+        # merged file left without a legacy file beside it is finished after a crash instead
+        # of being rebuilt with every legacy record a second time.
+        tmp_file = f"{self.jsonl_file}.tmp"
+        if not os.path.exists(self.json_file) and not os.path.exists(tmp_file):
+            return
+        with _jsonl_file_lock(self.jsonl_file):
+            if os.path.exists(self.json_file):
+                with open(self.json_file, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+                
+                with open(tmp_file, 'w', encoding='utf-8') as out:
+                    for item in legacy:
+                        out.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                    if os.path.exists(self.jsonl_file):
+                        with open(self.jsonl_file, 'r', encoding='utf-8') as existing:
+                            for line in existing:
+                                out.write(line if line.endswith("\n") else line + "\n")
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(self.json_file, f"{self.json_file}.migrated")
+            if os.path.exists(tmp_file):
+                os.replace(tmp_file, self.jsonl_file)
+    
+    def iter_json(self) -> Iterator[Dict]:
+        
+        self._migrate_json_array()
+        if not os.path.exists(self.jsonl_file):
+            return
+        with open(self.jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn final line from an interrupted append
+                    continue
+    
     def save_to_csv(self, summary_data: Dict):
        
         try:
@@ -96,34 +440,32 @@ class StorageManager:
     def save_to_sqlite(self, summary_data: Dict):
         
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO summaries (
-                    filename, file_type, file_size_kb, original_word_count,
-                    summary, summary_word_count, model_used, summary_length,
-                    date, extracted_text
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                summary_data['filename'],
-                summary_data['file_type'],
-                summary_data['file_size_kb'],
-                summary_data['original_word_count'],
-                summary_data['summary'],
-                summary_data['summary_word_count'],
-                summary_data['model_used'],
-                summary_data['summary_length'],
-                summary_data['date'],
-                summary_data['extracted_text']
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self._connection() as conn, conn:
+                conn.execute(INSERT_SUMMARY_SQL, tuple(summary_data[column] for column in SUMMARY_COLUMNS))
             
         except Exception as e:
             raise Exception(f"Error saving to SQLite: {str(e)}")
     
+    def save_many(self, summaries: List[Dict]) -> int:
+        
+        if not summaries:
+            return 0
+        try:
+            # One transaction (and one fsync) for the whole batch
+            with self._connection() as conn, conn:
+                conn.executemany(
+                    INSERT_SUMMARY_SQL,
+                    (tuple(summary_data[column] for column in SUMMARY_COLUMNS) for summary_data in summaries)
+                )
+            return len(summaries)
+            
+        except Exception as e:
+            raise Exception(f"Error saving batch to SQLite: {str(e)}")
+    
+    def write_behind(self, max_batch: Optional[int] = None, flush_interval: Optional[float] = None) -> SummaryWriteQueue:
+        
+        return SummaryWriteQueue(self, max_batch, flush_interval)
+    
     def get_all_summaries(self, storage_type: str = "sqlite") -> List[Dict]:
         
         try:
@@ -137,13 +479,68 @@ class StorageManager:
         except Exception as e:
             raise Exception(f"Error retrieving summaries: {str(e)}")
     
-    def _get_from_json(self) -> List[Dict]:
+    def get_summaries_page(self, limit: int = 50, cursor: Optional[List] = None, columns: Optional[Iterable[str]] = None,
+                           date_from: Optional[str] = None, date_to: Optional[str] = None,
+                           model: Optional[str] = None, file_type: Optional[str] = None) -> Dict:
         
-        if not os.path.exists(self.json_file):
-            return []
+        try:
+            columns = list(columns or LIST_COLUMNS)
+            unknown = [column for column in columns if column not in SUMMARY_COLUMNS]
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+            
+            conditions = []
+            params = []
+            if date_from:
+                conditions.append('date >= ?')
+                params.append(date_from)
+            if date_to:
+                conditions.append('date <= ?')
+                params.append(date_to)
+            if model:
+                conditions.append('model_used = ?')
+                params.append(model)
+            if file_type:
+                conditions.append('file_type = ?')
+                params.append(file_type)
+            if cursor:
+                # Keyset pagination on (date, id), which idx_date already orders
+                conditions.append('(date < ? OR (date = ? AND id < ?))')
+                params.extend([cursor[0], cursor[0], cursor[1]])
+            
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            sql = f'''
+                SELECT id, date, {', '.join(columns)}
+                FROM summaries
+                {where}
+                ORDER BY date DESC, id DESC
+                LIMIT ?
+            '''
+            with self._connection() as conn:
+                rows = conn.execute(sql, params + [limit + 1]).fetchall()
+            
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            items = [dict(zip(columns, row[2:])) for row in rows]
+            next_cursor = [rows[-1][1], rows[-1][0]] if has_more else None
+            return {'items': items, 'next_cursor': next_cursor}
+            
+        except Exception as e:
+            raise Exception(f"Error retrieving summaries page: {str(e)}")
+    
+    def iter_summaries(self, columns: Optional[Iterable[str]] = None, batch_size: int = 500, **filters) -> Iterator[Dict]:
+        
+        cursor = None
+        while True:
+            page = self.get_summaries_page(limit=batch_size, cursor=cursor, columns=columns, **filters)
+            yield from page['items']
+            cursor = page['next_cursor']
+            if cursor is None:
+                return
+    
+    def _get_from_json(self) -> List[Dict]:
         
-        with open(self.json_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return list(self.iter_json())
     
     def _get_from_csv(self) -> List[Dict]:
         
@@ -160,91 +557,29 @@ class StorageManager:
     
     def _get_from_sqlite(self) -> List[Dict]:
         
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        with self._connection() as conn:
+            rows = conn.execute(SELECT_SUMMARIES_SQL).fetchall()
         
-        cursor.execute('''
-            SELECT filename, file_type, file_size_kb, original_word_count,
-                   summary, summary_word_count, model_used, summary_length,
-                   date, extracted_text
-            FROM summaries
-            ORDER BY created_at DESC
-        ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        summaries = []
-        for row in rows:
-            summaries.append({
-                'filename': row[0],
-                'file_type': row[1],
-                'file_size_kb': row[2],
-                'original_word_count': row[3],
-                'summary': row[4],
-                'summary_word_count': row[5],
-                'model_used': row[6],
-                'summary_length': row[7],
-                'date': row[8],
-                'extracted_text': row[9]
-            })
-        
-        return summaries
+        return [self._row_to_dict(row) for row in rows]
     
     def get_statistics(self) -> Optional[Dict]:
         
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-           
-            cursor.execute('SELECT COUNT(*) FROM summaries')
-            total_documents = cursor.fetchone()[0]
+            # Everything the dashboard needs in a single aggregate query
+            with self._connection() as conn:
+                row = conn.execute(STATISTICS_SQL).fetchone()
             
+            total_documents, total_words, avg_summary_length, today_count, model_usage, file_types = row
             if total_documents == 0:
-                conn.close()
                 return None
             
-            
-            cursor.execute('SELECT SUM(original_word_count) FROM summaries')
-            total_words = cursor.fetchone()[0] or 0
-            
-           
-            cursor.execute('SELECT AVG(summary_word_count) FROM summaries')
-            avg_summary_length = cursor.fetchone()[0] or 0
-            
-            
-            cursor.execute('''
-                SELECT model_used, COUNT(*) 
-                FROM summaries 
-                GROUP BY model_used
-            ''')
-            model_usage = dict(cursor.fetchall())
-            
-            
-            cursor.execute('''
-                SELECT file_type, COUNT(*) 
-                FROM summaries 
-                GROUP BY file_type
-            ''')
-            file_type_distribution = dict(cursor.fetchall())
-            
-            
-            cursor.execute('''
-                SELECT COUNT(*) 
-                FROM summaries 
-                WHERE date(created_at) = date('now')
-            ''')
-            today_count = cursor.fetchone()[0]
-            
-            conn.close()
-            
             return {
                 'total_documents': total_documents,
                 'total_words': total_words,
                 'avg_summary_length': avg_summary_length,
-                'model_usage': model_usage,
-                'file_type_distribution': file_type_distribution,
+                # Key/value pairs rather than a JSON object, so a NULL model or type stays a None key
+                'model_usage': dict(json.loads(model_usage)) if model_usage else {},
+                'file_type_distribution': dict(json.loads(file_types)) if file_types else {},
                 'today_count': today_count
             }
             
@@ -252,11 +587,13 @@ class StorageManager:
             print(f"Error getting statistics: {str(e)}")
             return None
     
-    def search_summaries(self, query: str, storage_type: str = "sqlite") -> List[Dict]:
+    def search_summaries(self, query: str, storage_type: str = "sqlite", limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
         
         try:
             if storage_type.lower() == "sqlite":
-                return self._search_sqlite(query)
+                return self._search_sqlite(query, limit, offset)
+            elif storage_type.lower() == "json":
+                return self._filter_summaries(self.iter_json(), query)
             else:
                 
                 all_summaries = self.get_all_summaries(storage_type)
@@ -265,41 +602,41 @@ class StorageManager:
         except Exception as e:
             raise Exception(f"Error searching summaries: {str(e)}")
     
-    def _search_sqlite(self, query: str) -> List[Dict]:
-        
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+    def _fts_query(self, query: str) -> str:
+        # Every word becomes a quoted prefix term, so user input can't inject FTS syntax
+        terms = re.findall(r'\w+', query)
+        return " ".join(f'"{term}"*' for term in terms)
+    
+    def _search_sqlite(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
         
-        cursor.execute('''
-            SELECT filename, file_type, file_size_kb, original_word_count,
-                   summary, summary_word_count, model_used, summary_length,
-                   date, extracted_text
-            FROM summaries
-            WHERE filename LIKE ? OR summary LIKE ? OR extracted_text LIKE ?
-            ORDER BY created_at DESC
-        ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
+        limit = -1 if limit is None else limit
+        if self.fts_enabled:
+            match = self._fts_query(query)
+            if not match:
+                return []
+            with self._connection() as conn:
+                rows = conn.execute(FTS_SEARCH_SQL, (match, limit, offset)).fetchall()
+            results = []
+            for row in rows:
+                result = self._row_to_dict(row[:len(SUMMARY_COLUMNS)])
+                result['snippet'] = row[len(SUMMARY_COLUMNS)]
+                results.append(result)
+            return results
         
-        rows = cursor.fetchall()
-        conn.close()
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT filename, file_type, file_size_kb, original_word_count,
+                       summary, summary_word_count, model_used, summary_length,
+                       date, extracted_text
+                FROM summaries
+                WHERE filename LIKE ? OR summary LIKE ? OR extracted_text LIKE ?
+                ORDER BY created_at DESC
+                LIMIT ? OFFSET ?
+            ''', (f'%{query}%', f'%{query}%', f'%{query}%', limit, offset)).fetchall()
         
-        summaries = []
-        for row in rows:
-            summaries.append({
-                'filename': row[0],
-                'file_type': row[1],
-                'file_size_kb': row[2],
-                'original_word_count': row[3],
-                'summary': row[4],
-                'summary_word_count': row[5],
-                'model_used': row[6],
-                'summary_length': row[7],
-                'date': row[8],
-                'extracted_text': row[9]
-            })
-        
-        return summaries
+        return [self._row_to_dict(row) for row in rows]
     
-    def _filter_summaries(self, summaries: List[Dict], query: str) -> List[Dict]:
+    def _filter_summaries(self, summaries: Iterable[Dict], query: str) -> List[Dict]:
        
         query_lower = query.lower()
         filtered = []
@@ -316,11 +653,8 @@ class StorageManager:
         
         try:
             if storage_type.lower() == "sqlite":
-                conn = sqlite3.connect(self.db_file)
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM summaries WHERE filename = ?', (filename,))
-                conn.commit()
-                conn.close()
+                with self._connection() as conn, conn:
+                    conn.execute('DELETE FROM summaries WHERE filename = ?', (filename,))
             else:
                
                 raise Exception("Delete operation not implemented for JSON/CSV storage")
@@ -328,32 +662,118 @@ class StorageManager:
         except Exception as e:
             raise Exception(f"Error deleting summary: {str(e)}")
     
-    def export_summaries(self, format: str = "json", filename: str = None):
+    def export_summaries(self, format: str = "json", filename: str = None, batch_size: Optional[int] = None,
+                         compression: Optional[str] = None,
+                         progress_callback: Optional[Callable[[int, int], None]] = None):
         
         try:
-            summaries = self.get_all_summaries("sqlite")
+            format = format.lower()
+            batch_size = batch_size or STORAGE_CONFIG.get("export_batch_size", 1000)
+            if format == "parquet":
+                compression = compression or STORAGE_CONFIG.get("export_parquet_compression", "zstd")
+            elif compression not in (None, "gzip"):
+                raise Exception(f"Unsupported compression for {format}: {compression}")
             
             if not filename:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"summaries_export_{timestamp}.{format}"
+                if compression == "gzip" and format != "parquet":
+                    filename += ".gz"
             
-            if format.lower() == "json":
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(summaries, f, indent=2, ensure_ascii=False)
-            elif format.lower() == "csv":
-                with open(filename, 'w', newline='', encoding='utf-8') as f:
-                    fieldnames = [
-                        'filename', 'file_type', 'file_size_kb', 'original_word_count',
-                        'summary', 'summary_word_count', 'model_used', 'summary_length',
-                        'date', 'extracted_text'
-                    ]
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(summaries)
+            with self._connection() as conn:
+                total = conn.execute('SELECT COUNT(*) FROM summaries').fetchone()[0]
+            
+            # Rows are read and written one keyset page at a time, so memory stays bounded
+            batches = self._iter_export_batches(batch_size)
+            if format == "json":
+                written = self._export_json(batches, filename, compression, total, progress_callback)
+            elif format == "csv":
+                written = self._export_csv(batches, filename, compression, total, progress_callback)
+            elif format == "parquet":
+                written = self._export_parquet(batches, filename, compression, total, progress_callback)
             else:
                 raise Exception(f"Unsupported export format: {format}")
             
+            if progress_callback and written == 0:
+                progress_callback(0, total)
+            
             return filename
             
         except Exception as e:
-            raise Exception(f"Error exporting summaries: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Error exporting summaries: {str(e)}")
+    
+    def _iter_export_batches(self, batch_size: int) -> Iterator[List[Dict]]:
+        
+        cursor = None
+        while True:
+            page = self.get_summaries_page(limit=batch_size, cursor=cursor, columns=SUMMARY_COLUMNS)
+            if page['items']:
+                yield page['items']
+            cursor = page['next_cursor']
+            if cursor is None:
+                return
+    
+    def _open_export(self, filename: str, compression: Optional[str], newline: Optional[str] = None):
+        
+        if compression == "gzip":
+            return gzip.open(filename, 'wt', newline=newline, encoding='utf-8')
+        return open(filename, 'w', newline=newline, encoding='utf-8')
+    
+    def _export_json(self, batches: Iterable[List[Dict]], filename: str, compression: Optional[str],
+                     total: int, progress_callback: Optional[Callable[[int, int], None]]) -> int:
+        
+        written = 0
+        with self._open_export(filename, compression) as f:
+            f.write('[')
+            for batch in batches:
+                for summary in batch:
+                    f.write(',\n  ' if written else '\n  ')
+                    f.write(json.dumps(summary, ensure_ascii=False))
+                    written += 1
+                if progress_callback:
+                    progress_callback(written, total)
+            f.write('\n]\n' if written else ']\n')
+        return written
+    
+    def _export_csv(self, batches: Iterable[List[Dict]], filename: str, compression: Optional[str],
+                    total: int, progress_callback: Optional[Callable[[int, int], None]]) -> int:
+        
+        written = 0
+        with self._open_export(filename, compression, newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(SUMMARY_COLUMNS))
+            writer.writeheader()
+            for batch in batches:
+                writer.writerows(batch)
+                written += len(batch)
+                if progress_callback:
+                    progress_callback(written, total)
+        return written
+    
+    def _export_parquet(self, batches: Iterable[List[Dict]], filename: str, compression: str,
+                        total: int, progress_callback: Optional[Callable[[int, int], None]]) -> int:
+        
+        if not PARQUET_AVAILABLE:
+            raise Exception("pyarrow is not installed. Please install it to export Parquet files.")
+        
+        schema = pa.schema([
+            ('filename', pa.string()),
+            ('file_type', pa.string()),
+            ('file_size_kb', pa.float64()),
+            ('original_word_count', pa.int64()),
+            ('summary', pa.string()),
+            ('summary_word_count', pa.int64()),
+            ('model_used', pa.string()),
+            ('summary_length', pa.string()),
+            ('date', pa.string()),
+            ('extracted_text', pa.string())
+        ])
+        
+        written = 0
+        # Each batch becomes its own row group, so only one batch is ever held in memory
+        with pq.ParquetWriter(filename, schema, compression=compression) as writer:
+            for batch in batches:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+                if progress_callback:
+                    progress_callback(written, total)
+        return written
@@ -1,20 +1,45 @@
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
 import os
+import re
+import shutil
+import sqlite3
 import sys
 import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 import pandas as pd
 from docx import Document
 
 
 from document_processor import DocumentProcessor
-from llm_summarizer import LLMSummarizer
-from storage_manager import StorageManager
+from llm_summarizer import AsyncLLMSummarizer, LLMSummarizer
+import storage_manager
+from storage_manager import StorageManager, get_connection_pool
+from compliance_agent import ComplianceAgent
+from rule_engine import AhoCorasick, RuleEngine, luhn_valid
+from pii_detectors import PIIDetector, iban_valid
+from json_extractor import COMPLIANCE_SCHEMA, IncrementalJSONExtractor, parse_llm_json
+from compliance_batch import BatchBackend, ComplianceBatchRunner, LocalBatchBackend, OpenAIBatchBackend
+from compliance_store import ComplianceResultStore
+from llm_cache import LLMResponseCache
+from extraction_cache import ExtractionCache
+from text_chunker import TokenChunker
+from config import CHUNK_CONFIG
+import llm_clients
+from llm_scheduler import RequestScheduler, TokenBucket
+import token_counter
 
 class TestDocumentProcessor(unittest.TestCase):
     
     def setUp(self):
-        self.processor = DocumentProcessor()
+        self.processor = DocumentProcessor(use_cache=False)
     
     def test_clean_text(self):
         
@@ -23,6 +48,18 @@ class TestDocumentProcessor(unittest.TestCase):
         expected = "This is a test text with extra spaces."
         self.assertEqual(cleaned, expected)
     
+    def test_clean_text_preserves_paragraphs_and_pages(self):
+        
+        dirty_text = "First   paragraph\nline two\n\n \t \nSecond paragraph\fThird   page text"
+        cleaned = self.processor._clean_text(dirty_text)
+        self.assertEqual(
+            cleaned,
+            "[Page 1]\n\nFirst paragraph\nline two\n\nSecond paragraph\n\n[Page 2]\n\nThird page text"
+        )
+        
+        flat = self.processor._clean_text(dirty_text, preserve_structure=False)
+        self.assertEqual(flat, "First paragraph line two Second paragraph Third page text")
+    
     def test_txt_extraction(self):
    
        
@@ -32,10 +69,9 @@ class TestDocumentProcessor(unittest.TestCase):
         
         try:
             
-            mock_file = Mock()
+            mock_file = io.BytesIO("This is a test document.\nIt has multiple lines.\n".encode('utf-8'))
             mock_file.name = "test.txt"
             mock_file.type = "text/plain"
-            mock_file.read.return_value = "This is a test document.\nIt has multiple lines.\n".encode('utf-8')
             
             
             result = self.processor._extract_txt_text(mock_file)
@@ -45,6 +81,41 @@ class TestDocumentProcessor(unittest.TestCase):
         finally:
             os.unlink(temp_file)
     
+    def test_text_blocks_stream_with_encoding_detection(self):
+        
+        raw = ("Clause   one applies.\nContinued line.\n\n" * 400).encode('utf-8')
+        with patch.dict('document_processor.FILE_CONFIG', {'encoding_detect_bytes': 256}):
+            blocks = list(self.processor.iter_text_blocks(io.BytesIO(raw), block_size=512))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual("".join(blocks), self.processor._clean_text(raw.decode('utf-8')))
+        
+        latin = ("Donn\xe9es personnelles.\n\n" * 50).encode('latin-1')
+        blocks = list(self.processor.iter_text_blocks(io.BytesIO(latin), block_size=64))
+        self.assertTrue(blocks[0].startswith("Donn\xe9es personnelles."))
+    
+    def test_text_blocks_are_cut_without_newlines(self):
+        
+        raw = ("word " * 2000).encode('utf-8')
+        with patch.dict('document_processor.FILE_CONFIG', {'encoding_detect_bytes': 64}):
+            blocks = list(self.processor.iter_text_blocks(io.BytesIO(raw), block_size=256))
+        self.assertGreater(len(blocks), 1)
+        for block in blocks:
+            self.assertLessEqual(len(block), 5 * 256)
+        self.assertEqual("".join(blocks), self.processor._clean_text(raw.decode('utf-8')))
+    
+    def test_text_blocks_keep_separators_and_page_numbers(self):
+        
+        lines = "".join(f"Line {n} of the clause.\n" for n in range(200))
+        raw = ("Cover page.\f" + lines + "\f" + lines).encode('utf-8')
+        upload = io.BytesIO(raw)
+        upload.read()
+        with patch.dict('document_processor.FILE_CONFIG', {'encoding_detect_bytes': 64}):
+            blocks = list(self.processor.iter_text_blocks(upload, block_size=256))
+        self.assertGreater(len(blocks), 3)
+        text = "".join(blocks)
+        self.assertEqual(text, self.processor._clean_text(raw.decode('utf-8')))
+        self.assertEqual([text.count(f"[Page {n}]") for n in (1, 2, 3)], [1, 1, 1])
+    
     def test_csv_extraction(self):
        
         df = pd.DataFrame({
@@ -105,6 +176,122 @@ class TestDocumentProcessor(unittest.TestCase):
         finally:
             os.unlink(temp_file)
 
+    def test_pdf_parallel_extraction_matches_sequential(self):
+        
+        import fitz
+        from document_processor import get_page_for_offset
+        pdf = fitz.open()
+        for page_num in range(1, 5):
+            page = pdf.new_page()
+            page.insert_text((72, 72), f"Clause {page_num} applies.")
+        data = pdf.tobytes()
+        pdf.close()
+        
+        mock_file = Mock()
+        mock_file.read.return_value = data
+        sequential, offsets = self.processor._extract_pdf(mock_file)
+        with patch.dict('document_processor.FILE_CONFIG', {'pdf_parallel_min_pages': 1, 'pdf_max_workers': 2}):
+            parallel, parallel_offsets = self.processor._extract_pdf(mock_file)
+        
+        self.assertEqual(parallel, sequential)
+        self.assertEqual(parallel_offsets, offsets)
+        start, end = offsets[2]
+        self.assertEqual(sequential[start:end], "Clause 3 applies.")
+        self.assertEqual(get_page_for_offset(offsets, start + 3), 3)
+    
+    def test_pdf_handle_closed_when_page_extraction_fails(self):
+        
+        import fitz
+        pdf = fitz.open()
+        pdf.new_page()
+        data = pdf.tobytes()
+        pdf.close()
+        
+        opened = []
+        real_open = fitz.open
+        
+        def open_document(*args, **kwargs):
+            opened.append(real_open(*args, **kwargs))
+            return opened[-1]
+        
+        mock_file = Mock()
+        mock_file.read.return_value = data
+        with patch('document_processor.fitz.open', side_effect=open_document), \
+                patch('fitz.Page.get_text', side_effect=RuntimeError("bad page")):
+            with self.assertRaises(Exception):
+                self.processor._extract_pdf(mock_file)
+        self.assertTrue(opened[0].is_closed)
+    
+    def test_pdf_pool_is_shared_and_spawned(self):
+        
+        from document_processor import get_pdf_pool
+        pool = get_pdf_pool()
+        self.assertIs(get_pdf_pool(), pool)
+        self.assertEqual(pool._mp_context.get_start_method(), "spawn")
+
+class TestExtractionCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.processor = DocumentProcessor(use_cache=False)
+        self.processor.cache = ExtractionCache(cache_dir=self.cache_dir)
+    
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+    
+    def _upload(self, content):
+        upload = io.BytesIO(content)
+        upload.name = "notes.txt"
+        upload.type = "text/plain"
+        return upload
+    
+    def test_repeat_extraction_is_served_from_cache(self):
+        
+        upload = self._upload(b"Cached   document text.")
+        with patch.object(self.processor, '_extract_txt_text', wraps=self.processor._extract_txt_text) as extractor:
+            self.processor.supported_formats['text/plain'] = extractor
+            first, metadata = self.processor.extract_text_with_metadata(upload)
+            second = self.processor.extract_text(self._upload(b"Cached   document text."))
+        
+        self.assertEqual(first, "Cached document text.")
+        self.assertEqual(second, first)
+        self.assertEqual(extractor.call_count, 1)
+        self.assertEqual(metadata['name'], "notes.txt")
+    
+    def test_cache_hit_reports_current_upload_metadata(self):
+        
+        self.processor.extract_text(self._upload(b"Shared bytes."))
+        renamed = self._upload(b"Shared bytes.")
+        renamed.name = "copy.txt"
+        _, metadata = self.processor.extract_text_with_metadata(renamed)
+        self.assertEqual(metadata['name'], "copy.txt")
+    
+    def test_malformed_entry_is_a_miss(self):
+        
+        for content in ('{"metadata": {}}', '[1, 2]', '{not json'):
+            with open(os.path.join(self.cache_dir, "broken.json"), 'w', encoding='utf-8') as f:
+                f.write(content)
+            self.assertIsNone(self.processor.cache.get("broken"))
+    
+    def test_key_includes_extractor_version(self):
+        
+        data = b"same bytes"
+        self.assertNotEqual(
+            ExtractionCache.make_key(data, "text/plain", "1"),
+            ExtractionCache.make_key(data, "text/plain", "2")
+        )
+    
+    def test_eviction_by_size(self):
+        
+        self.processor.cache.max_size_bytes = 200
+        self.processor.cache.set("old", "a" * 60, {})
+        os.utime(os.path.join(self.cache_dir, "old.json"), (1, 1))
+        self.processor.cache.set("new", "b" * 60, {})
+        self.processor.cache.set("newest", "c" * 60, {})
+        
+        self.assertIsNone(self.processor.cache.get("old"))
+        self.assertIsNotNone(self.processor.cache.get("newest"))
+
 class TestLLMSummarizer(unittest.TestCase):
    
     def setUp(self):
@@ -146,6 +333,101 @@ class TestLLMSummarizer(unittest.TestCase):
         self.assertIsInstance(cost_info["estimated_cost_usd"], float)
         self.assertGreaterEqual(cost_info["estimated_cost_usd"], 0)
 
+class TestMapReduceSummarization(unittest.TestCase):
+    
+    def setUp(self):
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with patch('llm_summarizer.get_openai_client'):
+            self.summarizer = LLMSummarizer(use_cache=False)
+        self.summarizer.chunker = TokenChunker(max_tokens=1100, overlap_tokens=0)
+    
+    def test_long_text_is_summarized_in_tiers(self):
+        
+        calls = []
+        lock = threading.Lock()
+        
+        def complete(prompt, model=None, max_tokens=1024, temperature=0.5):
+            with lock:
+                calls.append(prompt)
+            return f"summary {len(calls)}."
+        
+        self.summarizer._complete = Mock(side_effect=complete)
+        sentence = " ".join(["word"] * 99) + "."
+        text = " ".join([sentence] * 50)
+        
+        summary = self.summarizer.summarize(text)
+        
+        section_calls = [p for p in calls if p.startswith("The following is one section")]
+        combine_calls = [p for p in calls if p.startswith("The following are summaries")]
+        self.assertEqual(len(section_calls), 5)
+        # fan-in of 2: 5 sections -> 3 groups -> 2 groups -> final summary
+        self.assertEqual(len(combine_calls), 5)
+        self.assertIn("comprehensive summary", calls[-1])
+        self.assertTrue(summary.startswith("summary"))
+    
+    def test_local_edit_only_recomputes_its_branch(self):
+        
+        self.summarizer.chunker = TokenChunker(max_tokens=300, content_defined=True)
+        
+        def run(text):
+            calls = []
+            self.summarizer._complete = Mock(side_effect=lambda prompt, **kwargs: calls.append(prompt) or f"summary {hashlib.sha256(prompt.encode()).hexdigest()[:12]}.")
+            self.summarizer.summarize(text)
+            return calls
+        
+        sentences = [f"Clause {i} sets out duty number {i}." for i in range(600)]
+        with patch.dict(CHUNK_CONFIG, {"section_summary_tokens": 30}):
+            before = set(run(" ".join(sentences)))
+            sentences[3] = "Clause 3 sets out the revised duty number 3 today."
+            missed = [p for p in run(" ".join(sentences)) if p not in before]
+        
+        # One section, the group above it and the final summary
+        self.assertEqual(len(missed), 3)
+        self.assertTrue(missed[0].startswith("The following is one section"))
+        self.assertIn("revised duty number 3", missed[0])
+        self.assertTrue(missed[1].startswith("The following are summaries"))
+        self.assertIn("comprehensive summary", missed[2])
+    
+    def test_short_text_uses_single_call(self):
+        
+        self.summarizer._complete = Mock(return_value="Short summary.")
+        self.assertEqual(self.summarizer.summarize("A short document."), "Short summary.")
+        self.summarizer._complete.assert_called_once()
+
+class TestGenerateStream(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        self.temp_db.close()
+        with patch('llm_summarizer.get_openai_client'):
+            self.summarizer = LLMSummarizer(use_cache=False)
+        self.summarizer.cache = LLMResponseCache(db_file=self.temp_db.name)
+    
+    def tearDown(self):
+        self.summarizer.cache._conn.close()
+        os.unlink(self.temp_db.name)
+    
+    def _event(self, content):
+        event = Mock()
+        event.choices = [Mock()]
+        event.choices[0].delta.content = content
+        return event
+    
+    def test_stream_yields_deltas_and_caches_result(self):
+        
+        create = self.summarizer.client.chat.completions.create
+        create.return_value = iter([self._event("Hello"), self._event(None), self._event(" world")])
+        
+        deltas = list(self.summarizer.generate_stream("prompt"))
+        self.assertEqual(deltas, ["Hello", " world"])
+        self.assertTrue(create.call_args.kwargs['stream'])
+        
+        # Second run is served whole from the cache
+        self.assertEqual(list(self.summarizer.generate_stream("prompt")), ["Hello world"])
+        self.assertEqual(create.call_count, 1)
+
 class TestStorageManager(unittest.TestCase):
     
     
@@ -158,15 +440,20 @@ class TestStorageManager(unittest.TestCase):
         self.storage = StorageManager()
         self.storage.db_file = self.temp_db.name
         self.storage._init_database()
+        
+        # File-backed stores live in a scratch directory, never the working directory
+        self.temp_dir = tempfile.mkdtemp()
+        self.storage.json_file = os.path.join(self.temp_dir, 'summaries.json')
+        self.storage.jsonl_file = os.path.join(self.temp_dir, 'summaries.jsonl')
+        self.storage.csv_file = os.path.join(self.temp_dir, 'summaries.csv')
     
     def tearDown(self):
         
-        if os.path.exists(self.temp_db.name):
-            os.unlink(self.temp_db.name)
-        if os.path.exists(self.storage.json_file):
-            os.unlink(self.storage.json_file)
-        if os.path.exists(self.storage.csv_file):
-            os.unlink(self.storage.csv_file)
+        self.storage.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.temp_db.name + suffix):
+                os.unlink(self.temp_db.name + suffix)
+        shutil.rmtree(self.temp_dir)
     
     def test_save_and_retrieve_sqlite(self):
        
@@ -218,6 +505,153 @@ class TestStorageManager(unittest.TestCase):
         self.assertEqual(summaries[0]['filename'], 'test.txt')
         self.assertEqual(summaries[0]['summary'], 'This is a JSON test summary.')
     
+    def test_full_text_search_ranking_and_pagination(self):
+        
+        self.assertTrue(self.storage.fts_enabled)
+        self.storage.save_many([
+            self._summary('gdpr_policy.pdf'),
+            self._summary('retention_notes.pdf'),
+            self._summary('unrelated.pdf')
+        ])
+        with self.storage._connection() as conn, conn:
+            conn.execute("UPDATE summaries SET summary = 'Data retention schedule for GDPR records.' WHERE filename = 'retention_notes.pdf'")
+        
+        results = self.storage.search_summaries("gdpr")
+        self.assertEqual([r['filename'] for r in results], ['gdpr_policy.pdf', 'retention_notes.pdf'])
+        self.assertIn('**', results[1]['snippet'])
+        
+        # Prefix matching and pagination
+        self.assertEqual(len(self.storage.search_summaries("reten")), 1)
+        self.assertEqual(len(self.storage.search_summaries("pdf", limit=2)), 2)
+        self.assertEqual(len(self.storage.search_summaries("pdf", limit=2, offset=2)), 1)
+        
+        # Triggers keep the index in sync on delete; FTS syntax in input is neutralised
+        self.storage.delete_summary('gdpr_policy.pdf')
+        self.assertEqual([r['filename'] for r in self.storage.search_summaries("gdpr")], ['retention_notes.pdf'])
+        self.assertEqual(self.storage.search_summaries('"'), [])
+    
+    def test_keyset_pagination_with_projection_and_filters(self):
+        
+        batch = []
+        for i in range(7):
+            item = self._summary(f'page_{i}.pdf', model='gpt-4' if i % 2 else 'gpt-3.5-turbo')
+            item['date'] = f'2024-01-0{i + 1}T00:00:00'
+            batch.append(item)
+        self.storage.save_many(batch)
+        
+        first = self.storage.get_summaries_page(limit=3)
+        self.assertEqual([item['filename'] for item in first['items']], ['page_6.pdf', 'page_5.pdf', 'page_4.pdf'])
+        self.assertNotIn('extracted_text', first['items'][0])
+        
+        rest = list(self.storage.iter_summaries(columns=['filename'], batch_size=2))
+        self.assertEqual(len(rest), 7)
+        self.assertEqual(rest[-1], {'filename': 'page_0.pdf'})
+        
+        second = self.storage.get_summaries_page(limit=3, cursor=first['next_cursor'])
+        self.assertEqual(second['items'][0]['filename'], 'page_3.pdf')
+        
+        filtered = self.storage.get_summaries_page(model='gpt-4', date_from='2024-01-03', columns=['filename', 'model_used'])
+        self.assertEqual([item['filename'] for item in filtered['items']], ['page_5.pdf', 'page_3.pdf'])
+        self.assertIsNone(filtered['next_cursor'])
+        
+        with self.assertRaises(Exception):
+            self.storage.get_summaries_page(columns=['filename; DROP TABLE summaries'])
+    
+    def test_streaming_export(self):
+        
+        self.storage.save_many([self._summary(f'export_{i}.pdf') for i in range(5)])
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir)
+        
+        progress = []
+        json_file = os.path.join(export_dir, 'export.json')
+        self.storage.export_summaries('json', json_file, batch_size=2,
+                                      progress_callback=lambda done, total: progress.append((done, total)))
+        with open(json_file, encoding='utf-8') as f:
+            exported = json.load(f)
+        self.assertEqual(len(exported), 5)
+        self.assertEqual(exported[0]['extracted_text'], 'Text of export_4.pdf.')
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+        
+        csv_file = os.path.join(export_dir, 'export.csv.gz')
+        self.storage.export_summaries('csv', csv_file, batch_size=2, compression='gzip')
+        with gzip.open(csv_file, 'rt', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[-1]['filename'], 'export_0.pdf')
+        
+        with self.assertRaises(Exception):
+            self.storage.export_summaries('csv', os.path.join(export_dir, 'bad.csv'), compression='zstd')
+    
+    @unittest.skipUnless(storage_manager.PARQUET_AVAILABLE, "pyarrow is not installed")
+    def test_parquet_export(self):
+        
+        self.storage.save_many([self._summary(f'parquet_{i}.pdf') for i in range(3)])
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir)
+        
+        parquet_file = os.path.join(export_dir, 'export.parquet')
+        self.storage.export_summaries('parquet', parquet_file, batch_size=2)
+        table = storage_manager.pq.read_table(parquet_file)
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.field('file_size_kb').type, storage_manager.pa.float64())
+    
+    def test_json_lines_append_and_migration(self):
+        
+        legacy = [self._summary('legacy_1.pdf'), self._summary('legacy_2.pdf')]
+        with open(self.storage.json_file, 'w', encoding='utf-8') as f:
+            json.dump(legacy, f)
+        
+        self.storage.save_to_json(self._summary('new.pdf'))
+        
+        self.assertFalse(os.path.exists(self.storage.json_file))
+        filenames = [item['filename'] for item in self.storage.iter_json()]
+        self.assertEqual(filenames, ['legacy_1.pdf', 'legacy_2.pdf', 'new.pdf'])
+        
+        # A torn final line is skipped rather than breaking the reader
+        with open(self.storage.jsonl_file, 'a', encoding='utf-8') as f:
+            f.write('{"filename": "torn')
+        self.assertEqual(len(self.storage.get_all_summaries("json")), 3)
+        self.assertEqual(len(self.storage.search_summaries("legacy", "json")), 2)
+    
+    def test_interrupted_migration_does_not_duplicate_records(self):
+        
+        with open(self.storage.jsonl_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self._summary('existing.pdf')) + "\n")
+        with open(self.storage.json_file, 'w', encoding='utf-8') as f:
+            json.dump([self._summary('legacy_1.pdf')], f)
+        
+        # Crash after the legacy file was retired but before the merged file replaced the old one
+        real_replace = os.replace
+        calls = []
+        
+        def replace(src, dst):
+            calls.append(dst)
+            if dst == self.storage.jsonl_file:
+                raise OSError("killed")
+            real_replace(src, dst)
+        
+        with patch('storage_manager.os.replace', side_effect=replace):
+            with self.assertRaises(OSError):
+                self.storage._migrate_json_array()
+        self.assertEqual(calls[0], self.storage.json_file + '.migrated')
+        
+        filenames = [item['filename'] for item in self.storage.iter_json()]
+        self.assertEqual(filenames, ['legacy_1.pdf', 'existing.pdf'])
+        self.storage._migrate_json_array()
+        self.assertEqual([item['filename'] for item in self.storage.iter_json()], ['legacy_1.pdf', 'existing.pdf'])
+    
+    @unittest.skipUnless(storage_manager.fcntl is not None, "fcntl is not available")
+    def test_json_lines_lock_excludes_other_holders(self):
+        
+        with storage_manager._jsonl_file_lock(self.storage.jsonl_file):
+            # flock is per open file, so a second descriptor stands in for another process
+            with open(f"{self.storage.jsonl_file}.lock", 'rb') as other:
+                with self.assertRaises(BlockingIOError):
+                    storage_manager.fcntl.flock(other.fileno(), storage_manager.fcntl.LOCK_EX | storage_manager.fcntl.LOCK_NB)
+        with open(f"{self.storage.jsonl_file}.lock", 'rb') as other:
+            storage_manager.fcntl.flock(other.fileno(), storage_manager.fcntl.LOCK_EX | storage_manager.fcntl.LOCK_NB)
+    
     def test_save_and_retrieve_csv(self):
         
         summary_data = {
@@ -270,6 +704,82 @@ class TestStorageManager(unittest.TestCase):
         self.assertEqual(stats['avg_summary_length'], 10.0)
         self.assertIn('gpt-3.5-turbo', stats['model_usage'])
     
+    def _summary(self, filename, model='gpt-4', file_type='application/pdf'):
+        return {
+            'filename': filename,
+            'file_type': file_type,
+            'file_size_kb': 10.0,
+            'original_word_count': 100,
+            'summary': f'Summary of {filename}.',
+            'summary_word_count': 4,
+            'model_used': model,
+            'summary_length': 'Short (100-200 words)',
+            'date': '2024-01-01T00:00:00',
+            'extracted_text': f'Text of {filename}.'
+        }
+    
+    def test_concurrent_writes_share_pooled_connections(self):
+        
+        def writer(worker):
+            for i in range(10):
+                self.storage.save_to_sqlite(self._summary(f'doc_{worker}_{i}.pdf', model=f'model-{worker % 2}'))
+        
+        threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        stats = self.storage.get_statistics()
+        self.assertEqual(stats['total_documents'], 40)
+        self.assertEqual(stats['total_words'], 4000)
+        self.assertEqual(stats['model_usage'], {'model-0': 20, 'model-1': 20})
+        self.assertEqual(stats['file_type_distribution'], {'application/pdf': 40})
+        self.assertEqual(stats['today_count'], 40)
+        
+        with self.storage._connection() as conn:
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(journal_mode.lower(), 'wal')
+    
+    def test_statistics_keep_missing_model_as_none(self):
+        
+        self.storage.save_to_sqlite(self._summary('known.pdf'))
+        self.storage.save_to_sqlite(self._summary('unknown.pdf', model=None))
+        stats = self.storage.get_statistics()
+        self.assertEqual(stats['model_usage'], {'gpt-4': 1, None: 1})
+    
+    def test_connection_returned_after_close_is_closed(self):
+        
+        pool = get_connection_pool(self.storage.db_file)
+        with pool.connection() as conn:
+            self.storage.close()
+        self.assertTrue(pool._idle.empty())
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+    
+    def test_save_many_in_one_transaction(self):
+        
+        batch = [self._summary(f'batch_{i}.pdf') for i in range(25)]
+        self.assertEqual(self.storage.save_many(batch), 25)
+        self.assertEqual(len(self.storage.get_all_summaries("sqlite")), 25)
+        self.assertEqual(self.storage.save_many([]), 0)
+        
+        broken = [self._summary('ok.pdf'), {'filename': 'missing_fields.pdf'}]
+        with self.assertRaises(Exception):
+            self.storage.save_many(broken)
+        self.assertEqual(len(self.storage.get_all_summaries("sqlite")), 25)
+    
+    def test_write_behind_queue_flushes(self):
+        
+        writer = self.storage.write_behind(max_batch=5, flush_interval=60)
+        for i in range(12):
+            writer.submit(self._summary(f'queued_{i}.pdf'))
+        writer.flush(timeout=5)
+        self.assertEqual(len(self.storage.get_all_summaries("sqlite")), 12)
+        writer.submit(self._summary('last.pdf'))
+        writer.close()
+        self.assertEqual(len(self.storage.get_all_summaries("sqlite")), 13)
+    
     def test_search_functionality(self):
        
         
@@ -298,6 +808,788 @@ class TestStorageManager(unittest.TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]['filename'], 'research_paper.pdf')
 
+class FakeEncoding:
+    # Offline stand-in for a tiktoken encoding: one token per word or punctuation mark
+    
+    def encode(self, text, disallowed_special=()):
+        return re.findall(r"\w+|[^\w\s]", text)
+
+class TestTokenChunker(unittest.TestCase):
+    
+    def setUp(self):
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_budget_from_context_window(self):
+        
+        chunker = TokenChunker(model="gpt-4", prompt_overhead=500, response_tokens=1024)
+        self.assertEqual(chunker.max_tokens, 8192 - 500 - 1024)
+        capped = TokenChunker(model="gpt-4", max_tokens=1000)
+        self.assertEqual(capped.max_tokens, 1000)
+    
+    def test_chunks_split_at_sentences_with_overlap(self):
+        
+        chunker = TokenChunker(max_tokens=12, overlap_tokens=4)
+        text = "One two three. Four five six. Seven eight nine. Ten eleven twelve."
+        chunks = list(chunker.iter_chunks(text))
+        
+        self.assertEqual(chunks[0], "One two three. Four five six. Seven eight nine.")
+        self.assertTrue(chunks[1].startswith("Seven eight nine."))
+        self.assertTrue(chunks[-1].endswith("Ten eleven twelve."))
+        for chunk in chunks:
+            self.assertLessEqual(chunker.count_tokens(chunk), 12)
+    
+    def test_oversized_sentence_is_split(self):
+        
+        chunker = TokenChunker(max_tokens=10, overlap_tokens=0)
+        text = " ".join(["word"] * 40)
+        chunks = list(chunker.iter_chunks(text))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(" ".join(chunks), text)
+    
+    def test_chunks_from_blocks_cover_whole_stream(self):
+        
+        chunker = TokenChunker(max_tokens=12, overlap_tokens=0)
+        blocks = [f"Sentence number {i} ends here." for i in range(40)]
+        chunks = list(chunker.iter_chunks_from_blocks(iter(blocks)))
+        
+        self.assertGreater(len(chunks), 1)
+        joined = " ".join(chunks)
+        for block in blocks:
+            self.assertIn(block, joined)
+        for chunk in chunks:
+            self.assertLessEqual(chunker.count_tokens(chunk), 12)
+    
+    def test_content_defined_chunks_resync_after_edit(self):
+        
+        sentences = [f"Clause {i} sets out duty number {i}." for i in range(300)]
+        revised = list(sentences)
+        revised.insert(150, "A brand new clause was inserted here.")
+        
+        content_defined = TokenChunker(max_tokens=300, content_defined=True)
+        before = set(content_defined.iter_chunks(" ".join(sentences)))
+        after = list(content_defined.iter_chunks(" ".join(revised)))
+        self.assertEqual(len([chunk for chunk in after if chunk not in before]), 1)
+        for chunk in after:
+            self.assertLessEqual(content_defined.count_tokens(chunk), 300)
+        
+        # Greedy packing shifts every boundary after the insertion
+        greedy = TokenChunker(max_tokens=300, overlap_tokens=0)
+        before = set(greedy.iter_chunks(" ".join(sentences)))
+        self.assertGreater(len([chunk for chunk in greedy.iter_chunks(" ".join(revised)) if chunk not in before]), 1)
+    
+    def test_truncate_returns_first_chunk(self):
+        
+        chunker = TokenChunker(max_tokens=8, overlap_tokens=0)
+        self.assertEqual(chunker.truncate("Short one. Another sentence here. And more."), "Short one. Another sentence here.")
+        self.assertEqual(chunker.truncate(""), "")
+
+class TestTokenCounter(unittest.TestCase):
+    
+    def setUp(self):
+        token_counter._count_cache.clear()
+        self.encoding = Mock(wraps=FakeEncoding())
+        patcher = patch('token_counter.get_encoding', return_value=self.encoding)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_counts_are_memoised_by_content(self):
+        
+        text = "Count these tokens, please."
+        self.assertEqual(token_counter.count_tokens(text), 6)
+        self.assertEqual(token_counter.count_tokens(text), 6)
+        self.assertEqual(self.encoding.encode.call_count, 1)
+        token_counter.count_tokens(text, model="gpt-4")
+        self.assertEqual(self.encoding.encode.call_count, 2)
+    
+    def test_large_inputs_use_estimate(self):
+        
+        text = "a" * 400
+        with patch.dict(token_counter.PERFORMANCE_CONFIG, {"exact_token_count_max_chars": 100}):
+            self.assertEqual(token_counter.count_tokens(text), 100)
+            self.assertTrue(token_counter.is_estimate(text))
+        self.encoding.encode.assert_not_called()
+
+class TestLLMResponseCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        self.temp_db.close()
+        self.cache = LLMResponseCache(db_file=self.temp_db.name, ttl=3600, max_size_mb=1)
+    
+    def tearDown(self):
+        self.cache._conn.close()
+        if os.path.exists(self.temp_db.name):
+            os.unlink(self.temp_db.name)
+    
+    def test_hit_and_miss_counters(self):
+        
+        key = self.cache.make_key("openai", "gpt-3.5-turbo", "prompt", 0.5, 1024)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, "cached response")
+        self.assertEqual(self.cache.get(key), "cached response")
+        
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+    
+    def test_key_depends_on_all_parameters(self):
+        
+        base = self.cache.make_key("openai", "gpt-4", "prompt", 0.5, 1024)
+        self.assertNotEqual(base, self.cache.make_key("gemini", "gpt-4", "prompt", 0.5, 1024))
+        self.assertNotEqual(base, self.cache.make_key("openai", "gpt-4", "prompt", 0.3, 1024))
+        self.assertNotEqual(base, self.cache.make_key("openai", "gpt-4", "prompt", 0.5, 512))
+    
+    def test_ttl_expiry(self):
+        
+        self.cache.ttl = 1
+        self.cache.set("key", "value")
+        with patch('llm_cache.time.time', return_value=time.time() + 5):
+            self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.get_stats()['entries'], 0)
+    
+    def test_lru_eviction_by_size(self):
+        
+        self.cache.max_size_bytes = 25
+        self.cache.set("first", "x" * 10)
+        self.cache.set("second", "y" * 10)
+        self.cache.get("first")
+        self.cache.set("third", "z" * 10)
+        
+        self.assertIsNotNone(self.cache.get("first"))
+        self.assertIsNone(self.cache.get("second"))
+        self.assertIsNotNone(self.cache.get("third"))
+    
+    def test_hits_batch_last_access_updates(self):
+        
+        self.cache.access_flush_every = 3
+        self.cache.set("key", "value")
+        statements = []
+        self.cache._conn.set_trace_callback(statements.append)
+        self.cache.get("key")
+        self.cache.get("key")
+        self.assertFalse([s for s in statements if not s.lstrip().upper().startswith("SELECT")])
+        
+        self.cache.get("other")
+        self.cache.set("other", "value")
+        self.assertTrue(any(s.lstrip().upper().startswith("UPDATE") for s in statements))
+        self.assertEqual(self.cache._pending_access, {})
+
+class TestLLMClients(unittest.TestCase):
+    
+    def setUp(self):
+        llm_clients.clear_clients()
+        self.addCleanup(llm_clients.clear_clients)
+    
+    def test_clients_are_reused_per_provider_model_and_key(self):
+        
+        first = llm_clients.get_openai_client("sk-test-1", "gpt-4")
+        self.assertIs(first, llm_clients.get_openai_client("sk-test-1", "gpt-4"))
+        self.assertIsNot(first, llm_clients.get_openai_client("sk-test-2", "gpt-4"))
+        self.assertIsNot(first, llm_clients.get_openai_client("sk-test-1", "gpt-3.5-turbo"))
+        
+        # Every client shares the same keep-alive pool
+        self.assertIs(first._client, llm_clients.get_http_client())
+    
+    def test_gemini_reconfigures_only_on_key_change_without_keeping_the_key(self):
+        
+        genai = Mock()
+        with patch.object(llm_clients, 'GEMINI_AVAILABLE', True), patch.object(llm_clients, 'genai', genai, create=True):
+            first = llm_clients.get_gemini_model("gm-secret-1")
+            self.assertIs(first, llm_clients.get_gemini_model("gm-secret-1"))
+            self.assertEqual(genai.configure.call_count, 1)
+            llm_clients.get_gemini_model("gm-secret-2")
+            self.assertEqual(genai.configure.call_count, 2)
+        module_state = [value for value in vars(llm_clients).values() if isinstance(value, str)]
+        self.assertNotIn("gm-secret-2", module_state)
+    
+    def test_async_clients_are_closed_with_the_summarizer(self):
+        
+        with patch('llm_summarizer.get_openai_client'):
+            summarizer = AsyncLLMSummarizer(openai_api_key="sk-test", use_cache=False)
+        
+        async def run():
+            async with summarizer:
+                client = llm_clients.get_async_openai_client("sk-test", "gpt-4")
+                self.assertIs(client, llm_clients.get_async_openai_client("sk-test", "gpt-4"))
+            return client._client
+        
+        http_client = asyncio.run(run())
+        self.assertTrue(http_client.is_closed)
+        self.assertEqual(len(llm_clients._async_clients), 0)
+    
+    def test_clear_clients_closes_async_pools_of_idle_loops(self):
+        
+        async def open_client():
+            return llm_clients.get_async_openai_client("sk-test", "gpt-4")._client
+        
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        http_client = loop.run_until_complete(open_client())
+        llm_clients.clear_clients()
+        self.assertTrue(http_client.is_closed)
+    
+    def test_summarizers_share_registered_client(self):
+        
+        first = LLMSummarizer(model="gpt-4", openai_api_key="sk-test", use_cache=False)
+        second = LLMSummarizer(model="gpt-4", openai_api_key="sk-test", use_cache=False)
+        self.assertIs(first.client, second.client)
+
+
+class FakeAPIError(Exception):
+    
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = Mock(status_code=status_code, headers=headers or {})
+
+
+class TestRequestScheduler(unittest.TestCase):
+    
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+        self.limiter = TokenBucket(rate=1000, capacity=1000, clock=lambda: self.now, sleep=self._sleep)
+        self.scheduler = RequestScheduler("openai", max_retries=3, base_delay=1, max_delay=30,
+                                          timeout=5, limiter=self.limiter, sleep=self._sleep)
+    
+    def _sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+    
+    def test_retries_transient_errors_honouring_retry_after(self):
+        
+        calls = Mock(side_effect=[FakeAPIError(429, {"retry-after": "7"}), FakeAPIError(503), "ok"])
+        self.assertEqual(self.scheduler.call(calls), "ok")
+        self.assertEqual(calls.call_count, 3)
+        self.assertEqual(self.sleeps[0], 7)
+        self.assertLessEqual(self.sleeps[-1], 2)
+        self.assertEqual(len(self.sleeps), 2)
+        # The 429 paused the shared bucket for every other caller
+        self.assertEqual(self.limiter.paused_until, 7)
+    
+    def test_non_retryable_and_exhausted_errors_are_raised(self):
+        
+        calls = Mock(side_effect=FakeAPIError(400))
+        with self.assertRaises(FakeAPIError):
+            self.scheduler.call(calls)
+        self.assertEqual(calls.call_count, 1)
+        
+        calls = Mock(side_effect=FakeAPIError(500))
+        with self.assertRaises(FakeAPIError):
+            self.scheduler.call(calls)
+        self.assertEqual(calls.call_count, 4)
+    
+    def test_token_bucket_waits_for_refill(self):
+        
+        now = [0.0]
+        waits = []
+        
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+        
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(waits, [0.5, 0.5])
+
+
+class TestAsyncLLMSummarizer(unittest.TestCase):
+    
+    def setUp(self):
+        with patch('llm_summarizer.get_openai_client'):
+            self.summarizer = AsyncLLMSummarizer(use_cache=False)
+        self.summarizer.scheduler = RequestScheduler("openai", limiter=TokenBucket(rate=1000, capacity=1000))
+        self.active = {'now': 0, 'peak': 0}
+    
+    async def _create(self, model, messages, max_tokens, temperature, timeout):
+        self.active['now'] += 1
+        self.active['peak'] = max(self.active['peak'], self.active['now'])
+        await asyncio.sleep(0.01)
+        self.active['now'] -= 1
+        response = Mock()
+        response.choices = [Mock(message=Mock(content=f"answer to {messages[0]['content']}"))]
+        return response
+    
+    def test_generate_many_bounds_concurrency_and_keeps_order(self):
+        
+        client = Mock()
+        client.chat.completions.create = self._create
+        prompts = [f"prompt {i}" for i in range(10)]
+        with patch('llm_summarizer.get_async_openai_client', return_value=client):
+            results = asyncio.run(self.summarizer.agenerate_many(prompts, limit=3))
+        
+        self.assertEqual(results, [f"answer to prompt {i}" for i in range(10)])
+        self.assertEqual(self.active['peak'], 3)
+
+
+class TestRuleEngine(unittest.TestCase):
+    
+    def test_aho_corasick_finds_overlapping_keywords(self):
+        
+        automaton = AhoCorasick([("he", 0), ("she", 1), ("his", 2), ("hers", 3)])
+        self.assertEqual(sorted(automaton.iter_matches("ushers")), [(1, 4, 1), (2, 4, 0), (2, 6, 3)])
+    
+    def test_luhn(self):
+        
+        self.assertTrue(luhn_valid("4111 1111 1111 1111"))
+        self.assertFalse(luhn_valid("4111 1111 1111 1112"))
+        self.assertFalse(luhn_valid("1234"))
+    
+    def test_default_rules_by_domain(self):
+        
+        text = "Patient MRN: 1234567 was diagnosed; outpatients can email clinic@example.com. Card 4111111111111112."
+        findings = RuleEngine(domain="HIPAA").scan(text)
+        self.assertEqual([f['rule'] for f in findings],
+                         ["Health information", "Medical record number", "Health information", "Email address"])
+        self.assertEqual(text[findings[1]['start']:findings[1]['end']], "MRN: 1234567")
+        
+        pci = RuleEngine(domain="PCI-DSS").scan("Stored 4111-1111-1111-1111 and 4111111111111112 for the cardholder.")
+        self.assertEqual([(f['rule'], f['kind']) for f in pci],
+                         [("Payment card number", "violation"), ("Cardholder data", "context")])
+    
+    def test_custom_rules_and_span_assignment(self):
+        
+        engine = RuleEngine([{"name": "Secret", "type": "regex", "patterns": [r"TOP-\d+"]}])
+        text = "Nothing here. Ref TOP-42 today."
+        findings = engine.scan(text)
+        self.assertEqual(engine.assign_to_spans(findings, [(0, 13), (14, len(text))]), [[], findings])
+    
+    def test_rules_without_patterns_are_skipped(self):
+        
+        engine = RuleEngine([{"name": "Data minimization"}, {"name": "Secret", "type": "regex", "patterns": [r"TOP-\d+"]}])
+        self.assertEqual([rule['name'] for rule in engine.rules], ["Data minimization", "Secret"])
+        self.assertEqual([f['rule'] for f in engine.scan("Ref TOP-42.")], ["Secret"])
+        self.assertFalse(RuleEngine([{"name": "Data minimization"}]).has_matchers)
+    
+    def test_invalid_custom_rules_are_rejected(self):
+        
+        with self.assertRaisesRegex(ValueError, "Broken"):
+            RuleEngine([{"name": "Broken", "type": "regex", "patterns": [r"(unclosed"]}])
+        with self.assertRaisesRegex(ValueError, "Checked"):
+            RuleEngine([{"name": "Checked", "type": "regex", "patterns": [r"\d+"], "validator": "mod97"}])
+    
+    def test_custom_regexes_keep_their_own_semantics(self):
+        
+        engine = RuleEngine([
+            {"name": "Repeated word", "type": "regex", "patterns": [r"\b(?P<word>\w+) (?P=word)\b"]},
+            {"name": "Doubled digit", "type": "regex", "patterns": [r"(\d)\1"]},
+            {"name": "Project code", "type": "regex", "patterns": [r"PRJ-\d+"], "case_sensitive": True},
+            {"name": "Inline flag", "type": "regex", "patterns": [r"(?x) ACME \s corp"], "case_sensitive": True},
+            {"name": "Any number", "type": "regex", "patterns": [r"\d+"]}
+        ])
+        text = "the the prj-1 PRJ-7 ACME corp ref 55"
+        self.assertEqual([(f['rule'], f['match']) for f in engine.scan(text)], [
+            ("Repeated word", "the the"), ("Any number", "1"), ("Project code", "PRJ-7"), ("Any number", "7"),
+            ("Inline flag", "ACME corp"), ("Doubled digit", "55"), ("Any number", "55")
+        ])
+
+
+class TestPIIDetector(unittest.TestCase):
+    
+    def test_batch_scan_maps_offsets_back_to_chunks(self):
+        
+        chunks = [
+            "Contact jane@example.com, SSN 123-45-6789, DOB: 01/02/1980.",
+            "No identifiers in this one.",
+            "Pay 4111 1111 1111 1111 or IBAN GB82 WEST 1234 5698 7654 32; call +1 415-555-1234.",
+            "Not a card: 4111 1111 1111 1112. Not an IBAN: GB00 WEST 1234 5698 7654 32."
+        ]
+        findings = PIIDetector().scan(chunks)
+        
+        self.assertEqual(findings['chunk_index'].tolist(), [0, 0, 0, 2, 2, 2])
+        self.assertEqual(findings['rule'].tolist(), ["Email address", "US Social Security number", "Date of birth",
+                                                     "Payment card number", "IBAN", "Phone number"])
+        for row in findings.itertuples():
+            self.assertEqual(chunks[row.chunk_index][row.start:row.end], row.match)
+    
+    def test_domain_filter_and_validators(self):
+        
+        self.assertTrue(iban_valid("DE89 3704 0044 0532 0130 00"))
+        self.assertFalse(iban_valid("DE00 3704 0044 0532 0130 00"))
+        
+        by_chunk = PIIDetector(domain="HIPAA").findings_by_chunk(["MRN: 12345678, card 4111 1111 1111 1111", ""])
+        self.assertEqual([f['rule'] for f in by_chunk[0]], ["Medical record number"])
+        self.assertEqual(by_chunk[1], [])
+        self.assertTrue(PIIDetector().scan([]).empty)
+
+
+class TestJSONExtraction(unittest.TestCase):
+    
+    def test_nested_objects_and_braces_in_strings(self):
+        
+        text = ('Here you go:\n```json\n{"compliance_summary": "Uses {placeholders}", '
+                '"approvals": [{"clause": {"id": 3}}], "violations": []}\n```\nAnything else?')
+        parsed = parse_llm_json(text, COMPLIANCE_SCHEMA)
+        self.assertEqual(parsed['compliance_summary'], "Uses {placeholders}")
+        self.assertEqual(parsed['approvals'], [{"clause": {"id": 3}}])
+    
+    def test_streamed_deltas_complete_at_closing_brace(self):
+        
+        extractor = IncrementalJSONExtractor()
+        deltas = ['Sure! {"compliance_summary": "ok", "viol', 'ations": ["a \\"}\\" b"]', '} trailing {"x": 1}']
+        self.assertEqual([extractor.feed(delta) for delta in deltas], [False, False, True])
+        self.assertEqual(json.loads(extractor.text()), {"compliance_summary": "ok", "violations": ['a "}" b']})
+    
+    def test_repairs_common_defects(self):
+        
+        parsed = parse_llm_json("{'compliance_summary': 'It\\'s fine', 'approvals': ['x',], 'violations': None}", COMPLIANCE_SCHEMA)
+        self.assertEqual(parsed, {"compliance_summary": "It's fine", "approvals": ["x"], "violations": []})
+        
+        truncated = parse_llm_json('{"compliance_summary": "cut off", "violations": ["one", "tw', COMPLIANCE_SCHEMA)
+        self.assertEqual(truncated['violations'], ["one", "tw"])
+        
+        with self.assertRaises(ValueError):
+            parse_llm_json('{"approvals": []}', COMPLIANCE_SCHEMA)
+        with self.assertRaises(ValueError):
+            parse_llm_json("No JSON here", COMPLIANCE_SCHEMA)
+    
+    def test_json_mode_is_sent_only_to_supporting_models(self):
+        
+        client = Mock()
+        client.chat.completions.create.return_value = Mock(choices=[Mock(message=Mock(content='{"a": 1}'))])
+        with patch('llm_summarizer.get_openai_client', return_value=client):
+            supported = LLMSummarizer(model="gpt-3.5-turbo", use_cache=False)
+            unsupported = LLMSummarizer(model="gpt-4", use_cache=False)
+        for summarizer in (supported, unsupported):
+            summarizer.scheduler = RequestScheduler("openai", limiter=TokenBucket(rate=1000, capacity=1000))
+        
+        supported.generate("Return JSON", json_mode=True)
+        self.assertEqual(client.chat.completions.create.call_args.kwargs['response_format'], {"type": "json_object"})
+        unsupported.generate("Return JSON", json_mode=True)
+        self.assertNotIn('response_format', client.chat.completions.create.call_args.kwargs)
+        
+        self.assertNotEqual(LLMResponseCache.make_key("openai", "gpt-4", "p", 0.5, 1024),
+                            LLMResponseCache.make_key("openai", "gpt-4", "p", 0.5, 1024, json_mode=True))
+
+
+class TestComplianceAgent(unittest.TestCase):
+    
+    def setUp(self):
+        with patch('compliance_agent.LLMSummarizer'):
+            self.agent = ComplianceAgent(domain="GDPR")
+    
+    def test_concurrent_results_keep_chunk_order(self):
+        
+        chunks = [f"Paragraph {i}" for i in range(6)]
+        self.agent.iter_chunks = Mock(return_value=iter(chunks))
+        active = {'now': 0, 'peak': 0}
+        lock = threading.Lock()
+        
+        def generate(prompt, json_mode=False):
+            with lock:
+                active['now'] += 1
+                active['peak'] = max(active['peak'], active['now'])
+            # Later chunks finish first
+            index = int(prompt.rsplit(' ', 1)[-1])
+            time.sleep(0.05 * (6 - index))
+            with lock:
+                active['now'] -= 1
+            if index == 2:
+                return "not json"
+            return f'{{"compliance_summary": "chunk {index}", "approvals": [], "violations": []}}'
+        
+        self.agent.llm.generate.side_effect = generate
+        results = self.agent.check_compliance("ignored", max_workers=3)
+        
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0]['compliance_summary'], 'chunk 0')
+        self.assertEqual(results[5]['compliance_summary'], 'chunk 5')
+        self.assertIn('parsing_error', results[2])
+        self.assertEqual(results[3]['compliance_summary'], 'chunk 3')
+        self.assertLessEqual(active['peak'], 3)
+        self.assertGreater(active['peak'], 1)
+    
+    def test_check_documents_streams_per_file_results_with_provenance(self):
+        
+        files = []
+        for name in ("slow.txt", "broken.txt", "fast.txt"):
+            uploaded = Mock()
+            uploaded.name = name
+            files.append(uploaded)
+        processor = Mock()
+        
+        def extract_text(f):
+            if f.name == "broken.txt":
+                raise Exception("corrupt file")
+            if f.name == "slow.txt":
+                time.sleep(0.1)
+            return f.name
+        
+        processor.iter_document_blocks.side_effect = lambda f: iter([extract_text(f)])
+        self.agent.iter_chunks = Mock(side_effect=lambda blocks: iter([f"{text} part {i}" for text in blocks for i in range(2)]))
+        self.agent.llm.generate.side_effect = lambda prompt, json_mode=False: (
+            f'{{"compliance_summary": "ok", "approvals": [], "violations": ["{prompt.rsplit(chr(10), 1)[-1]}"]}}'
+        )
+        
+        file_results = list(self.agent.check_documents(files, processor=processor, extraction_workers=3, llm_workers=2))
+        
+        self.assertEqual(file_results[-1]['source_file'], "slow.txt")
+        broken = next(r for r in file_results if r['source_file'] == "broken.txt")
+        self.assertEqual(broken['error'], "corrupt file")
+        
+        report = self.agent.aggregate_report(file_results)
+        self.assertEqual([f['source_file'] for f in report['files']], ["slow.txt", "broken.txt", "fast.txt"])
+        self.assertEqual(report['files_failed'], ["broken.txt"])
+        self.assertEqual(report['total_violations'], 4)
+        self.assertEqual([(r['source_file'], r['chunk_index']) for r in report['results']],
+                         [("slow.txt", 0), ("slow.txt", 1), ("fast.txt", 0), ("fast.txt", 1)])
+        self.assertEqual(report['results'][1]['violations'], ["slow.txt part 1"])
+    
+    def test_check_documents_streams_plain_text_blocks(self):
+        
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent.chunker = TokenChunker(max_tokens=40, overlap_tokens=0)
+        self.agent.llm.generate.return_value = '{"compliance_summary": "ok", "approvals": [], "violations": []}'
+        upload = io.BytesIO(("Clause one applies to every team.\n\n" * 200).encode('utf-8'))
+        upload.name = "policy.txt"
+        upload.type = "text/plain"
+        processor = DocumentProcessor(use_cache=False)
+        
+        with patch.dict('document_processor.FILE_CONFIG', {'text_block_size_kb': 1, 'encoding_detect_bytes': 256}), \
+                patch.object(processor, 'extract_text', side_effect=AssertionError("read whole")):
+            file_results = list(self.agent.check_documents([upload], processor=processor, llm_workers=2))
+        
+        self.assertIsNone(file_results[0]['error'])
+        self.assertEqual(len(file_results[0]['results']), self.agent.llm.generate.call_count)
+        self.assertEqual([r['chunk_index'] for r in file_results[0]['results']], list(range(len(file_results[0]['results']))))
+    
+    def test_prefilter_only_escalates_chunks_with_findings(self):
+        
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent.domain = "PCI-DSS"
+        self.agent.prefilter = True
+        self.agent.chunker = TokenChunker(max_tokens=8, overlap_tokens=0)
+        self.agent.llm.generate.return_value = '{"compliance_summary": "checked", "approvals": [], "violations": []}'
+        text = ("The office opens at nine. Lunch is served at noon. "
+                "Card 4111 1111 1111 1111 is on file. The garden is green.")
+        
+        results = self.agent.check_compliance(text, max_workers=1)
+        
+        self.assertEqual(self.agent.llm.generate.call_count, 1)
+        self.assertEqual(len(results), 1)
+        self.assertIn("Payment card number detected: 4111 1111 1111 1111", results[0]['violations'])
+        self.assertEqual(results[0]['rule_findings'][0]['category'], "PCI")
+        
+        self.agent.llm.generate.reset_mock()
+        results = self.agent.check_compliance("The office opens at nine. Lunch is served at noon.")
+        self.agent.llm.generate.assert_not_called()
+        self.assertTrue(results[0]['prefiltered'])
+        
+        report = self.agent.aggregate_report([{"source_file": "memo.txt", "file_index": 0, "results": results, "error": None}])
+        self.assertEqual(report['files'][0]['chunks_checked'], 0)
+        self.assertEqual(report['overall_status'], "Not Reviewed")
+    
+    def test_prefilter_sends_every_chunk_for_domains_without_rules(self):
+        
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent.chunker = TokenChunker(max_tokens=8, overlap_tokens=0)
+        self.agent.llm.generate.return_value = '{"compliance_summary": "checked", "approvals": [], "violations": ["Passwords stored in plaintext"]}'
+        text = "Passwords are stored in plaintext. Access reviews never happen. Backups are untested."
+        
+        for domain in ("SOC 2", "ISO 27001"):
+            self.agent.domain = domain
+            self.agent.prefilter = True
+            self.agent._rule_engine = None
+            self.agent.llm.generate.reset_mock()
+            
+            results = self.agent.check_compliance(text, max_workers=1)
+            
+            self.assertEqual(self.agent.rule_engine.rules, [])
+            self.assertEqual(self.agent.llm.generate.call_count, 3)
+            self.assertFalse(any(r.get('prefiltered') for r in results))
+            report = self.agent.aggregate_report([{"source_file": "policy.txt", "file_index": 0, "results": results, "error": None}])
+            self.assertEqual(report['overall_status'], "Needs Review")
+        
+        # Checklist rules with only a name behave the same way
+        self.agent.rules = [{"name": "Data minimization"}, {"name": "Access control"}]
+        self.agent._rule_engine = None
+        self.agent.llm.generate.reset_mock()
+        results = self.agent.check_compliance(text, max_workers=1)
+        self.assertEqual(self.agent.llm.generate.call_count, 3)
+        self.assertEqual(results[0]['rules_checked'], ["Data minimization", "Access control"])
+    
+    def test_pii_detector_findings_are_merged_into_violations(self):
+        
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent.detect_pii = True
+        self.agent.chunker = TokenChunker(max_tokens=1000, overlap_tokens=0)
+        self.agent.llm.generate.return_value = '{"compliance_summary": "checked", "approvals": [], "violations": ["Retention period missing"]}'
+        text = "Our policy covers data. Write to dpo@example.com for requests."
+        
+        results = self.agent.check_compliance(text, max_workers=1)
+        
+        self.assertEqual(results[0]['violations'], ["Retention period missing", "Email address detected: dpo@example.com"])
+        finding = results[0]['rule_findings'][0]
+        self.assertEqual(text[finding['start']:finding['end']], "dpo@example.com")
+    
+    def test_pii_detectors_escalate_chunks_the_prefilter_skipped(self):
+        
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent.domain = "PCI-DSS"
+        self.agent._rule_engine = None
+        self.agent.prefilter = True
+        self.agent.detect_pii = True
+        self.agent.chunker = TokenChunker(max_tokens=12, overlap_tokens=0)
+        self.agent.llm.generate.return_value = '{"compliance_summary": "checked", "approvals": [], "violations": []}'
+        text = ("The office opens at nine. Lunch is served at noon. "
+                "Refunds go to IBAN GB82 WEST 1234 5698 7654 32 today. Parking is free on weekends.")
+        
+        results = self.agent.check_compliance(text, max_workers=1)
+        
+        self.assertEqual(self.agent.llm.generate.call_count, 1)
+        self.assertIn("IBAN GB82", self.agent.llm.generate.call_args[0][0])
+        self.assertIn("IBAN detected: GB82 WEST 1234 5698 7654 32", results[0]['violations'])
+    
+    def test_incremental_recheck_only_sends_changed_chunks(self):
+        
+        patcher = patch('text_chunker.get_encoding', return_value=FakeEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        temp_db.close()
+        self.addCleanup(os.unlink, temp_db.name)
+        store = ComplianceResultStore(db_file=temp_db.name)
+        self.addCleanup(store._conn.close)
+        with patch('compliance_agent.LLMSummarizer'):
+            agent = ComplianceAgent(domain="GDPR", incremental=True)
+        agent._result_store = store
+        agent.chunker = TokenChunker(max_tokens=300, content_defined=True)
+        agent.llm.generate.side_effect = lambda prompt, json_mode=False: (
+            f'{{"compliance_summary": "{prompt.rsplit(" ", 1)[-1]}", "approvals": [], "violations": []}}'
+        )
+        sentences = [f"Clause {i} sets out duty number {i}." for i in range(300)]
+        
+        first = agent.check_compliance(" ".join(sentences), max_workers=1)
+        self.assertEqual(agent.llm.generate.call_count, len(first))
+        
+        agent.llm.generate.reset_mock()
+        sentences[150] = "Clause 150 now sets out a stricter duty."
+        revised = agent.check_compliance(" ".join(sentences), max_workers=1)
+        self.assertEqual(agent.llm.generate.call_count, 1)
+        self.assertEqual(len(revised), len(first))
+        self.assertEqual([r['compliance_summary'] for r in revised], [r['compliance_summary'] for r in first])
+        
+        # A different prompt cannot reuse verdicts given under the old one
+        agent.llm.generate.reset_mock()
+        agent.check_compliance(" ".join(sentences), custom_prompt="Check retention only.", max_workers=1)
+        self.assertEqual(agent.llm.generate.call_count, len(revised))
+        self.assertEqual(store.get_stats()['entries'], len(first) + 1 + len(revised))
+    
+    def test_async_check_matches_sync_parsing(self):
+        
+        self.agent.iter_chunks = Mock(return_value=iter(["Paragraph 0", "Paragraph 1"]))
+        self.agent._async_llm = Mock()
+        self.agent._async_llm.agenerate = AsyncMock(side_effect=[
+            '```json\n{"compliance_summary": "ok", "approvals": ["a"], "violations": []}\n```',
+            "not json"
+        ])
+        results = asyncio.run(self.agent.acheck_compliance("ignored", max_concurrency=2))
+        
+        self.assertEqual(results[0]['compliance_summary'], 'ok')
+        self.assertIn('parsing_error', results[1])
+
+
+class TestComplianceBatch(unittest.TestCase):
+    
+    def setUp(self):
+        with patch('compliance_agent.LLMSummarizer'):
+            self.agent = ComplianceAgent(domain="GDPR")
+        self.agent.iter_chunks = Mock(side_effect=lambda text: iter(text.split("|")))
+    
+    def test_batch_results_are_merged_per_document_in_chunk_order(self):
+        
+        def generate(prompt):
+            chunk = prompt.rsplit("\n", 1)[-1]
+            if chunk == "broken":
+                raise Exception("server error")
+            return f'{{"compliance_summary": "{chunk}", "approvals": [], "violations": []}}'
+        
+        batch_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, batch_dir)
+        sleeps = []
+        backend = LocalBatchBackend(generate, polls_until_complete=3)
+        runner = ComplianceBatchRunner(self.agent, backend, batch_dir=batch_dir, poll_interval=5,
+                                       max_requests_per_batch=2, sleep=sleeps.append)
+        
+        reports = runner.run({"a.pdf": "a0|a1|a2", "b.pdf": "b0|broken"})
+        
+        self.assertEqual([r['compliance_summary'] for r in reports["a.pdf"]], ["a0", "a1", "a2"])
+        self.assertEqual(reports["b.pdf"][0]['compliance_summary'], "b0")
+        self.assertIn('batch_error', reports["b.pdf"][1])
+        self.assertEqual(len(backend.jobs), 3)
+        self.assertEqual(len(os.listdir(batch_dir)), 3)
+        self.assertEqual(sleeps, [5, 5])
+    
+    def test_backend_must_implement_the_batch_api(self):
+        
+        class PartialBackend(BatchBackend):
+            def submit(self, requests):
+                return "job"
+        
+        with self.assertRaises(TypeError):
+            PartialBackend()
+        with self.assertRaises(TypeError):
+            BatchBackend()
+    
+    def test_openai_backend_parses_output_and_error_files(self):
+        
+        client = Mock()
+        client.get.return_value = {"id": "batch_1", "status": "completed", "output_file_id": "out", "error_file_id": "err"}
+        files = {
+            "out": json.dumps({"custom_id": "a.pdf::0", "response": {"status_code": 200, "body": {
+                "choices": [{"message": {"content": " {} "}}]}}}),
+            "err": json.dumps({"custom_id": "a.pdf::1", "response": {"status_code": 500, "body": {}}, "error": None})
+        }
+        client.files.content.side_effect = lambda file_id: Mock(text=files[file_id] + "\n")
+        
+        results = list(OpenAIBatchBackend(client=client, completion_window="24h").results("batch_1"))
+        
+        self.assertEqual(results[0], {"custom_id": "a.pdf::0", "content": "{}", "error": None})
+        self.assertEqual(results[1]["error"], "HTTP 500")
+    
+    def test_failed_and_expired_jobs_keep_every_chunk(self):
+        
+        client = Mock()
+        client.files.create.return_value = Mock(id="file_in")
+        client.post.return_value = {"id": "batch_1"}
+        client.get.return_value = {"id": "batch_1", "status": "failed", "output_file_id": None, "error_file_id": None,
+                                   "errors": {"data": [{"message": "Invalid model"}]}}
+        runner = ComplianceBatchRunner(self.agent, OpenAIBatchBackend(client=client, completion_window="24h"),
+                                       poll_interval=0, sleep=lambda seconds: None)
+        
+        reports = runner.run({"a.pdf": "a0|a1", "b.pdf": "b0"})
+        
+        self.assertEqual(sorted(reports), ["a.pdf", "b.pdf"])
+        self.assertEqual(len(reports["a.pdf"]), 2)
+        self.assertIn("failed", reports["b.pdf"][0]['batch_error'])
+        self.assertIn("Invalid model", reports["b.pdf"][0]['batch_error'])
+        
+        # An expired job that finished only the middle chunk keeps it at index 1
+        client.get.return_value = {"id": "batch_1", "status": "expired", "output_file_id": "out", "error_file_id": None}
+        client.files.content.return_value = Mock(text=json.dumps({"custom_id": "a.pdf::1", "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"content": '{"compliance_summary": "a1", "approvals": [], "violations": []}'}}]}}}) + "\n")
+        
+        reports = runner.run({"a.pdf": "a0|a1|a2"})
+        
+        self.assertIn("expired", reports["a.pdf"][0]['batch_error'])
+        self.assertEqual(reports["a.pdf"][1]['compliance_summary'], "a1")
+        self.assertIn("expired", reports["a.pdf"][2]['batch_error'])
+
+
 def run_tests():
   
     print("Running Document Summarizer Tests...")
@@ -308,8 +1600,22 @@ def run_tests():
     
 
     test_suite.addTest(unittest.makeSuite(TestDocumentProcessor))
+    test_suite.addTest(unittest.makeSuite(TestExtractionCache))
     test_suite.addTest(unittest.makeSuite(TestLLMSummarizer))
+    test_suite.addTest(unittest.makeSuite(TestMapReduceSummarization))
+    test_suite.addTest(unittest.makeSuite(TestGenerateStream))
     test_suite.addTest(unittest.makeSuite(TestStorageManager))
+    test_suite.addTest(unittest.makeSuite(TestTokenChunker))
+    test_suite.addTest(unittest.makeSuite(TestTokenCounter))
+    test_suite.addTest(unittest.makeSuite(TestLLMResponseCache))
+    test_suite.addTest(unittest.makeSuite(TestLLMClients))
+    test_suite.addTest(unittest.makeSuite(TestRequestScheduler))
+    test_suite.addTest(unittest.makeSuite(TestAsyncLLMSummarizer))
+    test_suite.addTest(unittest.makeSuite(TestRuleEngine))
+    test_suite.addTest(unittest.makeSuite(TestPIIDetector))
+    test_suite.addTest(unittest.makeSuite(TestJSONExtraction))
+    test_suite.addTest(unittest.makeSuite(TestComplianceAgent))
+    test_suite.addTest(unittest.makeSuite(TestComplianceBatch))
     
     
     runner = unittest.TextTestRunner(verbosity=2)
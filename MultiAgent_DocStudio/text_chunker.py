@@ -0,0 +1,183 @@
+import hashlib
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+from config import CHUNK_CONFIG
+from token_counter import get_encoding
+
+# A sentence ends at terminal punctuation followed by whitespace, or at a paragraph break
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])["\')\]]*\s+|\n\s*\n')
+
+def get_context_window(model: str) -> int:
+    
+    return CHUNK_CONFIG["context_windows"].get(model, CHUNK_CONFIG["default_context_window"])
+
+def content_boundary(text: str, divisor: int) -> bool:
+    # Stable across processes (unlike hash()) and blind to whitespace changes
+    digest = hashlib.blake2b(" ".join(text.split()).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % max(1, divisor) == 0
+
+class TokenChunker:
+    
+    def __init__(self, model: str = "gpt-3.5-turbo", max_tokens: Optional[int] = None,
+                 overlap_tokens: Optional[int] = None, prompt_overhead: Optional[int] = None,
+                 response_tokens: Optional[int] = None, content_defined: bool = False):
+        self.model = model
+        self.content_defined = content_defined
+        self._encoding = None
+        if prompt_overhead is None:
+            prompt_overhead = CHUNK_CONFIG["prompt_overhead_tokens"]
+        if response_tokens is None:
+            response_tokens = CHUNK_CONFIG["response_tokens"]
+        budget = get_context_window(model) - prompt_overhead - response_tokens
+        if budget <= 0:
+            raise ValueError(f"No token budget left for {model} after prompt overhead and response tokens")
+        self.max_tokens = min(max_tokens, budget) if max_tokens else budget
+        if overlap_tokens is None:
+            overlap_tokens = CHUNK_CONFIG["overlap_tokens"]
+        # Overlap must leave room for new content in every chunk
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.min_tokens = int(self.max_tokens * CHUNK_CONFIG["min_chunk_fraction"])
+        self.boundary_divisor = max(1, CHUNK_CONFIG["boundary_divisor"])
+    
+    @property
+    def encoding(self):
+        # Loaded on first use; tiktoken may need to fetch BPE files
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+    
+    def count_tokens(self, text: str) -> int:
+        
+        return len(self.encoding.encode(text, disallowed_special=()))
+    
+    def _iter_sentences(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        # Yields (start, end, tokens) for each sentence, splitting any sentence
+        # that is larger than a whole chunk at word boundaries.
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(text):
+            end = match.start() + len(match.group(0).rstrip())
+            if end > start:
+                yield from self._split_oversized(text, start, end)
+            start = match.end()
+        if start < len(text):
+            end = len(text.rstrip())
+            if end > start:
+                yield from self._split_oversized(text, start, end)
+    
+    def _split_oversized(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        
+        tokens = self.count_tokens(text[start:end])
+        if tokens <= self.max_tokens:
+            yield start, end, tokens
+            return
+        piece_start = start
+        piece_tokens = 0
+        last_end = start
+        for word in re.finditer(r'\S+', text[start:end]):
+            word_start, word_end = start + word.start(), start + word.end()
+            word_tokens = self.count_tokens(word.group(0)) + 1
+            if piece_tokens + word_tokens > self.max_tokens and piece_tokens:
+                yield piece_start, last_end, piece_tokens
+                piece_start = word_start
+                piece_tokens = 0
+            piece_tokens += word_tokens
+            last_end = word_end
+        if piece_tokens:
+            yield piece_start, last_end, piece_tokens
+    
+    def iter_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        
+        if self.content_defined:
+            return self._iter_content_defined_spans(text)
+        return self._iter_packed_spans(text)
+    
+    def _iter_packed_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        
+        window: List[Tuple[int, int, int]] = []
+        window_tokens = 0
+        for sentence in self._iter_sentences(text):
+            if window and window_tokens + sentence[2] > self.max_tokens:
+                yield window[0][0], window[-1][1]
+                # Carry trailing sentences forward as overlap, but always drop at least one
+                carried = []
+                carried_tokens = 0
+                for prev in reversed(window[1:]):
+                    if carried_tokens + prev[2] > self.overlap_tokens:
+                        break
+                    carried.insert(0, prev)
+                    carried_tokens += prev[2]
+                while carried and carried_tokens + sentence[2] > self.max_tokens:
+                    carried_tokens -= carried.pop(0)[2]
+                window = carried
+                window_tokens = carried_tokens
+            window.append(sentence)
+            window_tokens += sentence[2]
+        if window:
+            yield window[0][0], window[-1][1]
+    
+    def _is_boundary(self, sentence: str, window_tokens: int) -> bool:
+        # Past the midpoint between min and max the test loosens, so a chunk rarely hits the
+        # hard cap, whose cut point would depend on where the chunk started
+        divisor = self.boundary_divisor
+        if window_tokens >= (self.min_tokens + self.max_tokens) // 2:
+            divisor = divisor // 4
+        return content_boundary(sentence, divisor)
+    
+    def _iter_content_defined_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        # A chunk ends after a sentence whose hash hits the divisor once it holds min_tokens,
+        # so boundaries depend on nearby content rather than on everything before them and an
+        # edit only changes the chunks around it. No overlap is carried, since it would tie
+        # each chunk to its predecessor's text.
+        window_start = None
+        window_tokens = 0
+        last_end = 0
+        for start, end, tokens in self._iter_sentences(text):
+            if window_start is not None and window_tokens + tokens > self.max_tokens:
+                yield window_start, last_end
+                window_start = None
+                window_tokens = 0
+            if window_start is None:
+                window_start = start
+            window_tokens += tokens
+            last_end = end
+            if window_tokens >= self.min_tokens and self._is_boundary(text[start:end], window_tokens):
+                yield window_start, end
+                window_start = None
+                window_tokens = 0
+        if window_start is not None:
+            yield window_start, last_end
+    
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        
+        for start, end in self.iter_spans(text):
+            yield text[start:end]
+    
+    def iter_chunks_from_blocks(self, blocks: Iterable[str], separator: str = "\n\n") -> Iterator[str]:
+        # Chunks a stream of text blocks, holding back only the trailing partial
+        # chunk (plus its overlap) between blocks; pass separator="" for blocks that
+        # already carry their own leading separator
+        buffer = ""
+        buffer_limit = self.max_tokens * 8
+        for block in blocks:
+            buffer = f"{buffer}{separator}{block}" if buffer else block
+            if len(buffer) < buffer_limit:
+                continue
+            spans = list(self.iter_spans(buffer))
+            for start, end in spans[:-1]:
+                yield buffer[start:end]
+            if spans:
+                buffer = buffer[spans[-1][0]:]
+        if buffer:
+            yield from self.iter_chunks(buffer)
+    
+    def truncate(self, text: str) -> str:
+        # The largest sentence-aligned prefix that fits the budget, whatever the chunking mode
+        for start, end in self._iter_packed_spans(text):
+            return text[start:end]
+        return ""
+    
+    def fits(self, text: str) -> bool:
+        # True when the whole text fits one chunk; only the first two spans are measured
+        spans = self._iter_packed_spans(text)
+        next(spans, None)
+        return next(spans, None) is None
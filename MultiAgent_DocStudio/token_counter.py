@@ -0,0 +1,50 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import tiktoken
+from config import CHUNK_CONFIG, PERFORMANCE_CONFIG
+
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    # Loaded once per process and shared by every caller
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Non-OpenAI models (e.g. Gemini) get a close-enough BPE estimate
+        return tiktoken.get_encoding(CHUNK_CONFIG["default_encoding"])
+
+def estimate_tokens(text: str) -> int:
+    
+    if not text:
+        return 0
+    return max(1, len(text) // PERFORMANCE_CONFIG["estimated_chars_per_token"])
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo", exact: bool = None) -> int:
+    
+    if not text:
+        return 0
+    if exact is None:
+        exact = len(text) <= PERFORMANCE_CONFIG["exact_token_count_max_chars"]
+    if not exact:
+        return estimate_tokens(text)
+    
+    key = (model, hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest())
+    with _count_cache_lock:
+        if key in _count_cache:
+            _count_cache.move_to_end(key)
+            return _count_cache[key]
+    
+    count = len(get_encoding(model).encode(text, disallowed_special=()))
+    with _count_cache_lock:
+        _count_cache[key] = count
+        while len(_count_cache) > PERFORMANCE_CONFIG["token_count_cache_size"]:
+            _count_cache.popitem(last=False)
+    return count
+
+def is_estimate(text: str) -> bool:
+    
+    return len(text) > PERFORMANCE_CONFIG["exact_token_count_max_chars"]